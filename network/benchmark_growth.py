@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Compare the time taken to grow a network one node at a time:
+with the growing buffer of network_array.py, \
+or by concatenating new rows and columns onto the matrix (as add_nodes() used to).
+
+Concatenating copies the whole matrix for each new node, \
+so growing to n nodes takes time proportional to n**3, \
+and it is only timed up to a few thousand nodes.
+The buffer copies the matrix only when it grows by half, \
+so growing to n nodes takes time proportional to n**2 \
+(the size of the matrix, which has to be filled with zeros at some point anyway).
+
+By default the network grows to 20,000 nodes, \
+for which the buffer grows from 18,207 x 18,207 to 27,310 x 27,310 ints. \
+During that last copy both buffers are allocated: 8 GiB. \
+Most of those pages are never written (only the matrix and one entry per row), \
+and with NUMPY_MADVISE_HUGEPAGE=0 the peak memory in use is 3.8 GiB. \
+But on Linux numpy asks for huge pages (2 MiB) for large arrays by default, \
+and writing one int per row then makes almost all of both buffers resident: \
+about 8 GiB at the peak. \
+(Doubling instead grew the buffer from 16,384 x 16,384 to 32,768 x 32,768 ints: 10 GiB.)
+Give a number of nodes to grow to another size.
+python benchmark_growth.py
+NUMPY_MADVISE_HUGEPAGE=0 python benchmark_growth.py
+python benchmark_growth.py 15000
+"""
+
+import sys
+import time
+
+import numpy
+
+from network_array import Network
+
+
+class ConcatenatedNetwork(Network):
+    """
+    A network whose add_nodes() concatenates new rows and columns onto the matrix.
+    """
+    
+    def add_nodes(self, nNodes):
+        for ax in range(2):
+            shape = [nNodes, nNodes]
+            shape[1-ax] = self._buffer.shape[1-ax]
+            newPart = numpy.zeros(shape, dtype=int)
+            self._buffer = numpy.concatenate((self._buffer, newPart), axis=ax)
+        self.nNodes += nNodes
+
+
+def grow(network_class, checkpoints):
+    """
+    Grow a network from one node, adding one node at a time \
+    and connecting it to the previous node.
+    
+    Returns:
+    list of (number of nodes, seconds since the start) at each checkpoint
+    """
+    times = []
+    start = time.perf_counter()
+    network = network_class(1)
+    for node in range(1, max(checkpoints)):
+        network.add_nodes(1)
+        network.add_connection(node - 1, node)
+        if node + 1 in checkpoints:
+            assert network.nNodes == network.adjMat.shape[0] == network.adjMat.shape[1] == node + 1
+            times.append((node + 1, time.perf_counter() - start))
+    return times
+
+
+if __name__ == '__main__':
+    
+    max_nodes = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    checkpoints = [n for n in [1000, 2000, 3000, 5000, 10000, 15000, 20000] if n < max_nodes]
+    checkpoints.append(max_nodes)
+    old_checkpoints = [n for n in checkpoints if n <= 3000]
+    old_times = dict(grow(ConcatenatedNetwork, old_checkpoints))
+    
+    print('nodes\tconcatenate s\tbuffer s\tbuffer µs per node')
+    for nodes, seconds in grow(Network, checkpoints):
+        old = '{:.2f}'.format(old_times[nodes]) if nodes in old_times else '-'
+        print('{}\t{}\t{:.2f}\t{:.1f}'.format(nodes, old, seconds, seconds / nodes * 1e6))
@@ -13,6 +13,10 @@ class Network:
     Simple representation of a network as an adjacency matrix.
     
     The attribute Network.adjMat stores the matrix as a numpy array.
+    It is a view of the top left corner of a larger array, with room for more nodes.
+    When that room runs out, the larger array is replaced with one half as large again
+    (in each dimension), so adding n nodes one at a time copies the matrix only about
+    log1.5(n) times, and the unused room is at most 1.5**2 - 1 = 1.25 times the matrix.
     
     Add nodes and connections using methods:
     Network.add_node()
@@ -28,7 +32,20 @@ class Network:
         Add connections with Network.add_connection().
         """
         self.nNodes = nNodes
-        self.adjMat = numpy.zeros((nNodes, nNodes), dtype=int)
+        self._buffer = numpy.zeros((nNodes, nNodes), dtype=int)
+    
+    @property
+    def adjMat(self):
+        """
+        The adjacency matrix of the network
+        (a view of the part of the buffer in use).
+        """
+        return self._buffer[:self.nNodes, :self.nNodes]
+    
+    @adjMat.setter
+    def adjMat(self, matrix):
+        self._buffer = numpy.array(matrix, dtype=int)
+        self.nNodes = len(self._buffer)
     
     def __repr__(self):
         """
@@ -46,12 +63,16 @@ class Network:
         Nodes are initialized without connections.
         Add connections with Network.add_connection().
         """
-        for ax in range(2):
-            shape = [nNodes, nNodes]
-            shape[1-ax] = self.nNodes
-            newPart = numpy.zeros(shape, dtype=int)
-            self.adjMat = numpy.concatenate((self.adjMat, newPart), axis=ax)
-            self.nNodes += nNodes
+        newCount = self.nNodes + nNodes
+        capacity = len(self._buffer)
+        if newCount > capacity:
+            # At least 1.5 times the capacity, so that copying is rare.
+            # (Doubling would quadruple the size of the square buffer.)
+            newBuffer = numpy.zeros((max(newCount, capacity * 3 // 2),) * 2, dtype=int)
+            newBuffer[:self.nNodes, :self.nNodes] = self.adjMat
+            self._buffer = newBuffer
+        # The rest of the buffer is still all zeros (no connections).
+        self.nNodes = newCount
     
     def add_connection(self, nodeA, nodeB):
         """
@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Save and load a fitted partisan news model as a folder of files.
+
+The folder contains:
+meta.json        -- parameters, class labels, settings of each component \
+                    (including the dtype the vectorizer counts in), and a key
+vocabulary.json  -- the features, in the order of the vectorizer's columns
+*.npy            -- numeric arrays (idf, selected features, naive Bayes counts)
+
+Loading memory-maps the numeric arrays instead of reading them into memory, \
+and does not load spacy (the tagger loads it the first time it is needed). \
+So a scoring process can start quickly even with a very large vocabulary.
+"""
+
+import json
+import os
+
+import numpy as np
+from sklearn.feature_extraction.text import CountVectorizer, TfidfTransformer
+from sklearn.feature_selection import chi2, SelectPercentile
+from sklearn.naive_bayes import MultinomialNB
+from sklearn.pipeline import Pipeline
+
+import cache
+import preprocessing
+
+
+# Increase when the contents of the folder change.
+FORMAT_VERSION = 2
+
+
+class SavedSelectPercentile(SelectPercentile):
+    """
+    SelectPercentile that can use a saved support mask instead of the chi2 scores.
+    Fitting it again discards the saved mask.
+    """
+    
+    def fit(self, X, y):
+        self.__dict__.pop('support_mask_', None)
+        return super().fit(X, y)
+    
+    def _get_support_mask(self):
+        if hasattr(self, 'support_mask_'):
+            return self.support_mask_
+        return super()._get_support_mask()
+
+
+def make_key(parameters, data_filenames, settings=None):
+    """
+    Return a key identifying a model trained with some parameters on some data files.
+    
+    The key changes if the parameters, the data files (size or modification time), \
+    the spacy version, or any other settings given (such as compact mode) change.
+    """
+    data = [(filename, os.path.getsize(filename), os.path.getmtime(filename))
+            for filename in data_filenames]
+    description = {'parameters': parameters,
+                   'data': data,
+                   'spacy_version': preprocessing.spacy_version()}
+    if settings:
+        description['settings'] = settings
+    return cache.hash_parameters(description)
+
+
+def read_meta(directory):
+    """
+    Return the meta data of a saved model, or None if there is none.
+    """
+    try:
+        with open(os.path.join(directory, 'meta.json'), encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def exists(directory, key=None):
+    """
+    Whether a saved model exists in the folder (with a matching key, if given).
+    """
+    meta = read_meta(directory)
+    if meta is None or meta.get('format_version') != FORMAT_VERSION:
+        return False
+    return key is None or meta.get('key') == key
+
+
+def save(model, directory, parameters, key=None):
+    """
+    Save a fitted pipeline of tag, vectorize, transform, select and classify steps.
+    
+    Required arguments:
+    model      -- fitted pipeline
+    directory  -- folder to save in (created if necessary)
+    parameters -- dictionary of the parameters the model was trained with
+    
+    Optional keyword arguments:
+    key        -- key identifying the model, for example from make_key()
+                  defaults to None
+    """
+    steps = model.named_steps
+    vectorizer = steps['vectorize']
+    transformer = steps['transform']
+    classifier = steps['classify']
+    os.makedirs(directory, exist_ok=True)
+    
+    # Features in column order.
+    features = [None] * len(vectorizer.vocabulary_)
+    for feature, i in vectorizer.vocabulary_.items():
+        features[i] = feature
+    with open(os.path.join(directory, 'vocabulary.json'), mode='w', encoding='utf-8') as f:
+        json.dump(features, f, ensure_ascii=False)
+    
+    arrays = {'idf': transformer.idf_,
+              'support': steps['select'].get_support(),
+              'feature_log_prob': classifier.feature_log_prob_,
+              'class_log_prior': classifier.class_log_prior_,
+              'feature_count': classifier.feature_count_,
+              'class_count': classifier.class_count_}
+    for name, array in arrays.items():
+        np.save(os.path.join(directory, name + '.npy'), np.asarray(array))
+    
+    # Write the meta data last, so a folder with meta data is complete.
+    meta = {'format_version': FORMAT_VERSION,
+            'key': key,
+            'parameters': parameters,
+            'classes': [str(c) for c in classifier.classes_],
+            'vectorize': {'min_df': vectorizer.min_df, 'max_df': vectorizer.max_df,
+                          'dtype': np.dtype(vectorizer.dtype).name},
+            'transform': {'norm': transformer.norm,
+                          'use_idf': transformer.use_idf,
+                          'smooth_idf': transformer.smooth_idf,
+                          'sublinear_tf': transformer.sublinear_tf},
+            'select': {'percentile': steps['select'].percentile},
+            'classify': {'alpha': classifier.alpha, 'fit_prior': classifier.fit_prior}}
+    with open(os.path.join(directory, 'meta.json'), mode='w', encoding='utf-8') as f:
+        json.dump(meta, f, indent=1)
+
+
+def load(directory, mmap_mode='r'):
+    """
+    Load a saved pipeline.
+    
+    Required arguments:
+    directory -- folder the model was saved in
+    
+    Optional keyword arguments:
+    mmap_mode -- memory-map mode for the numeric arrays (see numpy.load())
+                 defaults to 'r' (read-only)
+                 None reads them into memory
+    
+    The tagger of the loaded pipeline tags in a single process and has no cache.
+    Change that with model.set_params(tag__n_process=..., tag__cache=...).
+    The components can be refitted, for example by cross-validation.
+    """
+    meta = read_meta(directory)
+    if meta is None:
+        raise FileNotFoundError('no saved model in {}'.format(directory))
+    if meta.get('format_version') != FORMAT_VERSION:
+        raise ValueError('the model in {} was saved in format {}, not {}: fit and save it again'
+                         .format(directory, meta.get('format_version'), FORMAT_VERSION))
+    
+    def array(name):
+        return np.load(os.path.join(directory, name + '.npy'), mmap_mode=mmap_mode)
+    
+    with open(os.path.join(directory, 'vocabulary.json'), encoding='utf-8') as f:
+        features = json.load(f)
+    n_features = len(features)
+    
+    tagger = preprocessing.Tagger(meta['parameters'])
+    
+    vectorize = dict(meta['vectorize'], dtype=np.dtype(meta['vectorize']['dtype']).type)
+    vectorizer = CountVectorizer(analyzer=preprocessing.identity, **vectorize)
+    vectorizer.vocabulary_ = {feature: i for i, feature in enumerate(features)}
+    
+    transformer = TfidfTransformer(**meta['transform'])
+    transformer.idf_ = array('idf')
+    transformer.n_features_in_ = n_features
+    
+    feature_selecter = SavedSelectPercentile(chi2, **meta['select'])
+    feature_selecter.support_mask_ = array('support')
+    feature_selecter.n_features_in_ = n_features
+    
+    classifier = MultinomialNB(**meta['classify'])
+    classifier.classes_ = np.array(meta['classes'])
+    classifier.feature_log_prob_ = array('feature_log_prob')
+    classifier.class_log_prior_ = array('class_log_prior')
+    classifier.feature_count_ = array('feature_count')
+    classifier.class_count_ = array('class_count')
+    classifier.n_features_in_ = classifier.feature_log_prob_.shape[1]
+    
+    return Pipeline([('tag', tagger),
+                     ('vectorize', vectorizer),
+                     ('transform', transformer),
+                     ('select', feature_selecter),
+                     ('classify', classifier)])
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Compare the spacy and fast preprocessing backends on the bundled corpus.
+
+For each backend, tag the training texts (timing how many texts per second are tagged), \
+then cross-validate the model of partisan_news.py on the resulting features.
+Reports the speed of each backend, and the change in each cross-validated score \
+when the fast backend is used instead of spacy.
+
+Builds the fast backend's lexicon first from the training texts, if there is none yet \
+(which needs spacy). The cross-validation folds are training texts, \
+so their words were all seen in building the lexicon, and the change in the scores is optimistic. \
+To show by how much, the fraction of tokens missing from the lexicon is reported \
+for the training texts and for the held-out texts, which the fast backend will meet in use.
+"""
+
+from datetime import datetime
+import os
+import time
+
+import numpy as np
+from sklearn.model_selection import cross_validate
+
+import fast_tagging
+import preprocessing
+import sweep
+
+
+def benchmark(texts, labels, parameters, batch_size=50, n_process=1):
+    """
+    Tag and cross-validate with one backend.
+    
+    Required arguments:
+    texts      -- sequence of raw texts
+    labels     -- sequence of their labels
+    parameters -- dictionary of parameters, including 'backend'
+    
+    Optional keyword arguments:
+    batch_size -- number of texts per batch sent to spacy
+                  defaults to 50
+    n_process  -- number of processes for spacy to use
+                  defaults to 1
+    
+    Returns:
+    dictionary of texts tagged per second and mean cross-validated scores
+    """
+    start = time.perf_counter()
+    annotations = preprocessing.annotate(texts, parameters,
+                                         batch_size=batch_size, n_process=n_process)
+    seconds = time.perf_counter() - start
+    features = [preprocessing.features_from_annotations(annotation, parameters)
+                for annotation in annotations]
+    cv_result = cross_validate(sweep.make_model(parameters), features, labels,
+                               cv=parameters['k_folds'], scoring=sweep.make_scorers())
+    result = {'docs_per_s': len(texts) / seconds}
+    for key, value in cv_result.items():
+        if key.startswith('test_'):
+            result[key[len('test_'):]] = np.mean(value)
+    return result
+
+
+def table(results):
+    """
+    Return the results as lines of a tab-separated table,
+    with a row for the change from spacy to fast.
+    
+    Required arguments:
+    results -- dictionary from backend names to dictionaries from benchmark()
+    """
+    names = list(results['spacy'])
+    lines = ['\t'.join(['backend'] + names)]
+    for backend, result in results.items():
+        lines.append('\t'.join([backend] + ['{:.3f}'.format(result[name]) for name in names]))
+    change = ['{:+.3f}'.format(results['fast'][name] - results['spacy'][name])
+              for name in names]
+    change[0] = 'x{:.1f}'.format(results['fast']['docs_per_s'] / results['spacy']['docs_per_s'])
+    lines.append('\t'.join(['fast - spacy'] + change))
+    return lines
+
+
+if __name__ == '__main__':
+    
+    from sklearn.model_selection import train_test_split
+    
+    from settings import parameters, tagger_settings
+    import corpus
+    
+    # Read the texts, and use only the training data (as in partisan_news.py).
+    documents = corpus.Corpus(['mainstream', 'partisan'])
+    train_items, test_items, train_labels, test_labels = train_test_split(
+        documents.view(), documents.labels, stratify=documents.labels, random_state=0)
+    
+    if not os.path.exists(fast_tagging.LEXICON_FILENAME):
+        print('Building lexicon...')
+        lexicon = fast_tagging.lexicon_from_texts(train_items, parameters, **tagger_settings)
+        fast_tagging.save_lexicon(lexicon)
+    lexicon = fast_tagging.get_lexicon()
+    unknown = {name: fast_tagging.unknown_rate((preprocessing.clean(text, parameters)
+                                                for text in items), lexicon)
+               for name, items in [('training', train_items), ('held-out', test_items)]}
+    
+    results = {}
+    for backend in ['spacy', 'fast']:
+        print('Benchmarking {} backend...'.format(backend))
+        results[backend] = benchmark(train_items, train_labels,
+                                     dict(parameters, backend=backend), **tagger_settings)
+    
+    # Write the table to a results file.
+    timestamp = datetime.now().strftime('%d_%b_%Y_%H%M')
+    lines = table(results)
+    lines += ['tokens not in the lexicon: {:.2%} of training texts, {:.2%} of held-out texts'
+              .format(unknown['training'], unknown['held-out'])]
+    with open(timestamp + '_backends.log', mode='w', encoding='utf-8') as f:
+        f.write('PARTISAN NEWS PREPROCESSING BACKENDS\n{}\n\n'.format(timestamp))
+        f.write('[{} texts, spacy with {}]\n'.format(len(train_items), tagger_settings))
+        f.write('\n'.join(lines) + '\n')
+    print(*lines, sep='\n')
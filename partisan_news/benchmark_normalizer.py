@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Compare the time taken to clean a text for tagging:
+quotes.remove() followed by replace_curlies() (five passes over the text), \
+or the single-pass preprocessing.normalizer().
+
+Checks that both give the same result for every text in the corpus, \
+then times both on the longest texts and reports the time per text.
+"""
+
+from timeit import timeit
+
+import corpus
+import preprocessing
+import quotes
+
+
+def chain(text):
+    """
+    Clean a text with quotes.remove() and then replace_curlies().
+    """
+    return preprocessing.replace_curlies(quotes.remove(text))
+
+
+def time_per_text(func, texts, number=10):
+    """
+    Return the mean time in microseconds taken by func for each of some texts.
+    """
+    seconds = timeit(lambda: [func(text) for text in texts], number=number)
+    return seconds / number / len(texts) * 1e6
+
+
+if __name__ == '__main__':
+    
+    fused = preprocessing.normalizer(remove_quotes=True, replace_curly_quotes=True)
+    texts = list(corpus.Corpus(['mainstream', 'partisan']).view())
+    
+    n_different = sum(chain(text) != fused(text) for text in texts)
+    print('{} of {} texts cleaned differently'.format(n_different, len(texts)))
+    
+    # The longest tenth of the texts.
+    long_texts = sorted(texts, key=len)[-len(texts) // 10:]
+    print('{} long texts, mean length {:.0f} characters'.format(
+        len(long_texts), sum(map(len, long_texts)) / len(long_texts)))
+    
+    chain_time = time_per_text(chain, long_texts)
+    fused_time = time_per_text(fused, long_texts)
+    print('remove + replace_curlies: {:.1f} µs per text'.format(chain_time))
+    print('normalizer:               {:.1f} µs per text'.format(fused_time))
+    print('speedup: {:.2f}x'.format(chain_time / fused_time))
@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+A two-tier cache for the output of a text preprocessing function.
+
+Results are kept in memory (least recently used are evicted first) \
+and also written to a directory on disk, so that a later run of the script \
+can reuse them without running the preprocessing again.
+Each result is stored under a hash of the raw text \
+and of the parameters that affect preprocessing.
+"""
+
+from collections import OrderedDict
+import hashlib
+import json
+import os
+import pickle
+
+
+def hash_parameters(parameters):
+    """
+    Return a hex digest identifying a dictionary of parameters.
+    
+    Required arguments:
+    parameters -- dictionary of JSON-serializable values
+    """
+    dump = json.dumps(parameters, sort_keys=True, default=str)
+    return hashlib.sha1(dump.encode('utf-8')).hexdigest()
+
+
+class PreprocessCache:
+    """
+    Cache the results of a preprocessing function of one text.
+    
+    Call the cache object in place of the function itself.
+    For example as the analyzer of a CountVectorizer.
+    
+    The attributes memory_hits, disk_hits and misses count lookups.
+    """
+    
+    def __init__(self, func, parameters, directory='.preprocess_cache',
+                 max_memory=2000, max_disk=100000):
+        """
+        Required arguments:
+        func       -- function taking a text string and returning a picklable result
+        parameters -- dictionary of the settings that affect the result of func
+        
+        Optional keyword arguments:
+        directory  -- folder for the on-disk store
+                      defaults to '.preprocess_cache'
+                      if None, results are cached only in memory
+        max_memory -- maximum number of results to keep in memory
+                      defaults to 2000
+        max_disk   -- maximum number of results to keep on disk
+                      defaults to 100000
+        
+        The parameters are hashed once, when the cache is created.
+        Results for different parameters are kept in separate subfolders.
+        """
+        self.func = func
+        self.parameters_hash = hash_parameters(parameters)
+        self.max_memory = max_memory
+        self.max_disk = max_disk
+        self.memory = OrderedDict()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        if directory is None:
+            self.directory = None
+            self.disk = OrderedDict()
+        else:
+            self.directory = os.path.join(directory, self.parameters_hash)
+            os.makedirs(self.directory, exist_ok=True)
+            self.disk = self._scan_disk()
+    
+    def __call__(self, text):
+        """
+        Return func(text), from the cache if possible.
+        """
+        result = self.get(text)
+        if result is None:
+            result = self.func(text)
+            self.put(text, result)
+        return result
+    
+    def __getstate__(self):
+        """
+        Leave out the results and the index of the disk store when pickling.
+        """
+        state = self.__dict__.copy()
+        state['memory'] = OrderedDict()
+        state['disk'] = OrderedDict()
+        return state
+    
+    def __setstate__(self, state):
+        """
+        Reconnect to the disk store when unpickling.
+        """
+        self.__dict__.update(state)
+        if self.directory is not None:
+            os.makedirs(self.directory, exist_ok=True)
+            self.disk = self._scan_disk()
+    
+    def __deepcopy__(self, memo):
+        """
+        Copies of a cache share the same store.
+        (Scikit-learn deep-copies the parameters of a pipeline in cross-validation.)
+        """
+        return self
+    
+    def get(self, text):
+        """
+        Return the cached result for a text, or None (counted as a miss).
+        """
+        key = self.key(text)
+        if key in self.memory:
+            self.memory.move_to_end(key)
+            self.memory_hits += 1
+            return self.memory[key]
+        result = self._read_disk(key)
+        if result is None:
+            self.misses += 1
+            return None
+        self.disk_hits += 1
+        self._remember(key, result)
+        return result
+    
+    def put(self, text, result):
+        """
+        Store the result for a text.
+        Use together with get() when the results are computed in batches.
+        """
+        key = self.key(text)
+        self._write_disk(key, result)
+        self._remember(key, result)
+    
+    def key(self, text):
+        """
+        Return the cache key for a text.
+        """
+        digest = hashlib.sha1(self.parameters_hash.encode('ascii'))
+        digest.update(text.encode('utf-8'))
+        return digest.hexdigest()
+    
+    def stats(self):
+        """
+        Return a dictionary of the hit and miss counts.
+        """
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        hits = self.memory_hits + self.disk_hits
+        return {'memory hits': self.memory_hits,
+                'disk hits': self.disk_hits,
+                'misses': self.misses,
+                'hit rate': hits / lookups if lookups else 0.0,
+                'in memory': len(self.memory),
+                'on disk': len(self.disk)}
+    
+    def _remember(self, key, result):
+        self.memory[key] = result
+        while len(self.memory) > self.max_memory:
+            self.memory.popitem(last=False)
+    
+    def _path(self, key):
+        return os.path.join(self.directory, key + '.pickle')
+    
+    def _scan_disk(self):
+        # Index the files already on disk, least recently used first.
+        entries = [(entry.stat().st_mtime, entry.name[:-len('.pickle')])
+                   for entry in os.scandir(self.directory)
+                   if entry.name.endswith('.pickle')]
+        return OrderedDict((key, None) for mtime, key in sorted(entries))
+    
+    def _read_disk(self, key):
+        if key not in self.disk:
+            return None
+        path = self._path(key)
+        try:
+            with open(path, mode='rb') as f:
+                result = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            del self.disk[key]
+            return None
+        # Mark as recently used, for this run and the next.
+        self.disk.move_to_end(key)
+        os.utime(path)
+        return result
+    
+    def _write_disk(self, key, result):
+        if self.directory is None:
+            return
+        # Write to a temporary file first,
+        # so an interrupted run never leaves a truncated entry behind.
+        path = self._path(key)
+        temp_path = '{}.{}.tmp'.format(path, os.getpid())
+        with open(temp_path, mode='wb') as f:
+            pickle.dump(result, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_path, path)
+        self.disk[key] = None
+        while len(self.disk) > self.max_disk:
+            old_key, _ = self.disk.popitem(last=False)
+            try:
+                os.remove(self._path(old_key))
+            except FileNotFoundError:
+                pass
+
+
+if __name__ == '__main__':
+    
+    import tempfile
+    
+    with tempfile.TemporaryDirectory() as directory:
+        
+        # A cache around str.split(), holding at most two results on disk.
+        cache = PreprocessCache(str.split, {'example': True},
+                                directory=directory, max_memory=1, max_disk=2)
+        for text in ['a b', 'c d', 'a b', 'e f', 'a b']:
+            print(text, '->', cache(text))
+        print(cache.stats())
+        
+        # A new cache in the same folder finds the earlier results on disk.
+        cache = PreprocessCache(str.split, {'example': True}, directory=directory)
+        cache('a b')
+        print(cache.stats())
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Check download.convert() offline, on a tiny archive written to a temporary folder.
+
+The articles are laid out like those of the corpus (with a <mainText> element), \
+plus one with no orientation and one whose text is missing, which should both be skipped.
+Converts the archive in this process and in a pool of processes, \
+and checks the text files written each time.
+"""
+
+import os
+import tempfile
+import zipfile
+
+import download
+
+
+ARTICLE = """<?xml version="1.0" encoding="UTF-8"?>
+<article>
+  <author>Someone</author>
+  {orientation}
+  <title>A headline</title>
+  <mainText>{text}</mainText>
+</article>
+"""
+
+ARTICLES = {'articles/0001.xml': ('mainstream', 'The first mainstream text.'),
+            'articles/0002.xml': ('left', 'A left partisan text &amp; more.'),
+            'articles/0003.xml': ('right', 'A right partisan text.'),
+            'articles/0004.xml': (None, 'A text with no orientation.'),
+            'articles/0005.xml': ('mainstream', 'The document has moved here.'),
+            'articles/0006.xml': ('mainstream', 'The second mainstream text.')}
+
+EXPECTED = {'mainstream.txt': 'The first mainstream text.\nThe second mainstream text.\n',
+            'partisan.txt': 'A left partisan text & more.\nA right partisan text.\n'}
+
+
+def write_archive(zipfilename):
+    """
+    Write the example articles to a zip file.
+    """
+    with zipfile.ZipFile(zipfilename, mode='w') as zf:
+        for name, (orientation, text) in ARTICLES.items():
+            if orientation:
+                orientation = '<orientation>{}</orientation>'.format(orientation)
+            zf.writestr(name, ARTICLE.format(orientation=orientation or '', text=text))
+        zf.writestr('articles/README.txt', 'not an article')
+
+
+if __name__ == '__main__':
+    
+    with tempfile.TemporaryDirectory() as directory:
+        zipfilename = os.path.join(directory, 'articles.zip')
+        write_archive(zipfilename)
+        mapping = {'mainstream': os.path.join(directory, 'mainstream.txt'),
+                   'right': os.path.join(directory, 'partisan.txt'),
+                   'left': os.path.join(directory, 'partisan.txt')}
+        
+        for n_jobs in [1, 2]:
+            n_texts = download.convert(zipfilename, mapping, n_jobs=n_jobs, chunksize=2)
+            assert n_texts == 4, n_texts
+            for filename, expected in EXPECTED.items():
+                with open(os.path.join(directory, filename), encoding='utf-8') as f:
+                    assert f.read() == expected, filename
+            print('n_jobs={}: {} texts written, as expected'.format(n_jobs, n_texts))
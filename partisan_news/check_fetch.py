@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Check fetch.fetch() offline, against a small web server running in this process \
+(with http.server), into a cache in a temporary folder.
+
+The server sends an ETag and Last-Modified with its file, answers conditional requests \
+with 304 Not Modified, and Range requests with 206 Partial Content \
+(unless If-Range names another version of the file). It can also be told \
+to break off its next answer halfway through, like an interrupted download.
+
+Checks, in order:
+an interrupted download is kept as a .part file, and the next fetch resumes it \
+with a Range request and gets the whole file (with the right checksum);
+fetching again downloads nothing (304);
+a changed file is downloaded again;
+an interrupted download of a file that then changes again on the server \
+is not resumed (its ETag no longer matches) but downloaded in full.
+"""
+
+import hashlib
+import http.server
+import os
+import tempfile
+import threading
+
+import fetch
+
+
+class FileHandler(http.server.BaseHTTPRequestHandler):
+    """
+    Serve the server's content (server.content) at any address, \
+    noting the headers and status of each request in server.requests.
+    """
+    
+    def do_GET(self):
+        server = self.server
+        content = server.content
+        etag = '"{}"'.format(hashlib.sha256(content).hexdigest()[:16])
+        status, start = 200, 0
+        if self.headers.get('If-None-Match') == etag:
+            status = 304
+        elif self.headers.get('Range') and self.headers.get('If-Range') in (None, etag):
+            status = 206
+            start = int(self.headers['Range'].split('=')[1].rstrip('-'))
+        server.requests.append({'range': self.headers.get('Range'),
+                                'if_range': self.headers.get('If-Range'),
+                                'status': status})
+        self.send_response(status)
+        self.send_header('ETag', etag)
+        self.send_header('Last-Modified', server.last_modified)
+        if status == 304:
+            self.end_headers()
+            return
+        body = content[start:]
+        if status == 206:
+            self.send_header('Content-Range', 'bytes {}-{}/{}'.format(
+                start, len(content) - 1, len(content)))
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if server.interrupt:
+            # Send only half of it, and close the connection.
+            server.interrupt = False
+            body = body[:len(body) // 2]
+            self.close_connection = True
+        self.wfile.write(body)
+    
+    def log_message(self, format, *args):
+        pass
+
+
+def start_server(content):
+    """
+    Start a server for some content (bytes) in a background thread.
+    
+    Returns:
+    the server (stop it with server.shutdown())
+    the web address of its file
+    """
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), FileHandler)
+    server.content = content
+    server.last_modified = 'Mon, 01 Jan 2024 00:00:00 GMT'
+    server.interrupt = False
+    server.requests = []
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, 'http://127.0.0.1:{}/articles.zip'.format(server.server_address[1])
+
+
+def interrupted_fetch(url, directory):
+    """
+    Fetch a file whose download is broken off, and return the size of the .part file kept.
+    """
+    try:
+        fetch.fetch(url, directory)
+    except Exception as e:
+        print('interrupted download: {}'.format(type(e).__name__))
+    else:
+        raise AssertionError('the interrupted download did not fail')
+    part = fetch.cache_path(url, directory) + '.part'
+    assert os.path.exists(part), 'no .part file kept'
+    return os.path.getsize(part)
+
+
+def check_fetched(result, content, downloaded):
+    """
+    Check the result of fetch.fetch() against the file on the server.
+    """
+    path, record, was_downloaded = result
+    assert was_downloaded == downloaded, was_downloaded
+    with open(path, mode='rb') as f:
+        assert f.read() == content
+    assert record['size'] == len(content), record
+    assert record['sha256'] == hashlib.sha256(content).hexdigest(), record
+    assert not os.path.exists(path + '.part')
+
+
+if __name__ == '__main__':
+    
+    versions = [os.urandom(300000) for version in range(3)]
+    server, url = start_server(versions[0])
+    with tempfile.TemporaryDirectory() as directory:
+        
+        # An interrupted download, then resumed.
+        server.interrupt = True
+        offset = interrupted_fetch(url, directory)
+        assert 0 < offset < len(versions[0]), offset
+        checksum = 'md5:' + hashlib.md5(versions[0]).hexdigest()
+        check_fetched(fetch.fetch(url, directory, checksum=checksum), versions[0], True)
+        request = server.requests[-1]
+        assert request['status'] == 206, request
+        assert request['range'] == 'bytes={}-'.format(offset), request
+        print('resumed from byte {} of {} (206), checksum as expected'.format(
+            offset, len(versions[0])))
+        
+        # Not changed: nothing downloaded.
+        check_fetched(fetch.fetch(url, directory, checksum=checksum), versions[0], False)
+        assert server.requests[-1]['status'] == 304, server.requests[-1]
+        print('fetched again: not modified (304)')
+        
+        # Changed: downloaded again.
+        server.content = versions[1]
+        check_fetched(fetch.fetch(url, directory), versions[1], True)
+        assert server.requests[-1]['status'] == 200, server.requests[-1]
+        print('changed on the server: downloaded again (200)')
+        
+        # Interrupted, then changed again before it is resumed: downloaded in full.
+        server.content = versions[2]
+        server.interrupt = True
+        offset = interrupted_fetch(url, directory)
+        server.content = versions[0]
+        check_fetched(fetch.fetch(url, directory), versions[0], True)
+        request = server.requests[-1]
+        assert request['range'] == 'bytes={}-'.format(offset), request
+        assert request['if_range'] is not None, request
+        assert request['status'] == 200, request
+        print('interrupted at byte {}, then changed on the server: '
+              'ETag no longer matches, downloaded in full (200)'.format(offset))
+    server.shutdown()
@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Fit a pipeline one step at a time, saving a checkpoint after each step.
+
+A checkpoint holds the output of a step for the training texts \
+(the lists of features from the tagger as a pickle, \
+the document-term, tf-idf and selected feature matrices as compressed .npz files) \
+and the fitted attributes of the step (for example the vectorizer's vocabulary_).
+
+Each checkpoint is keyed by the parameters that produced it, \
+chained with the key of the checkpoint before it, \
+so changing a parameter invalidates that step's checkpoint and all later ones. \
+fit() resumes from the latest valid checkpoint and fits only the remaining steps.
+"""
+
+import json
+import os
+import pickle
+
+from scipy import sparse
+
+import cache
+
+
+def stage_keys(base, parameters, stage_parameters, stage_settings=None):
+    """
+    Return a dictionary from the name of each stage to its key.
+    
+    Required arguments:
+    base             -- JSON-serializable description of the data (for example file names and sizes)
+    parameters       -- dictionary of parameters
+    stage_parameters -- dictionary from stage names (in pipeline order) \
+                        to lists of the parameters that affect each stage
+    
+    Optional keyword arguments:
+    stage_settings   -- dictionary from stage names to JSON-serializable settings \
+                        that affect them but are not parameters (for example a dtype)
+                        defaults to None (no other settings)
+    """
+    stage_settings = stage_settings or {}
+    keys = {}
+    key = cache.hash_parameters(base)
+    for stage, names in stage_parameters.items():
+        description = {'previous': key,
+                       'parameters': {name: parameters[name] for name in names}}
+        if stage_settings.get(stage):
+            description['settings'] = stage_settings[stage]
+        key = cache.hash_parameters(description)
+        keys[stage] = key
+    return keys
+
+
+def fitted_attributes(estimator):
+    """
+    Return a dictionary of the fitted attributes of an estimator
+    (by scikit-learn convention, those whose names end with an underscore).
+    """
+    return {name: value for name, value in vars(estimator).items()
+            if name.endswith('_') and not name.startswith('_')}
+
+
+class Checkpoints:
+    """
+    The checkpoints of the stages of a pipeline, saved in a folder.
+    One checkpoint is kept for each stage (with the latest key).
+    """
+    
+    def __init__(self, directory, keys):
+        """
+        Required arguments:
+        directory -- folder to save the checkpoints in (created if necessary)
+        keys      -- dictionary from stage names to keys, from stage_keys()
+        """
+        self.directory = directory
+        self.keys = keys
+        os.makedirs(directory, exist_ok=True)
+    
+    def _path(self, stage, name):
+        return os.path.join(self.directory, '{}.{}'.format(stage, name))
+    
+    def valid(self, stage):
+        """
+        Whether there is a checkpoint for a stage with its current key.
+        """
+        try:
+            with open(self._path(stage, 'json'), encoding='utf-8') as f:
+                return json.load(f)['key'] == self.keys[stage]
+        except (OSError, ValueError, KeyError):
+            return False
+    
+    def save(self, stage, estimator, output):
+        """
+        Save the fitted attributes and output of a stage.
+        """
+        # Invalidate the old checkpoint first, in case saving is interrupted.
+        if os.path.exists(self._path(stage, 'json')):
+            os.remove(self._path(stage, 'json'))
+        if sparse.issparse(output):
+            filename = self._path(stage, 'npz')
+            sparse.save_npz(filename + '.tmp.npz', output, compressed=True)
+            os.replace(filename + '.tmp.npz', filename)
+        else:
+            filename = self._path(stage, 'pickle')
+            with open(filename + '.tmp', mode='wb') as f:
+                pickle.dump(output, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(filename + '.tmp', filename)
+        with open(self._path(stage, 'fitted.pickle'), mode='wb') as f:
+            pickle.dump(fitted_attributes(estimator), f, protocol=pickle.HIGHEST_PROTOCOL)
+        # Write the key last, so a checkpoint with a key is complete.
+        with open(self._path(stage, 'json'), mode='w', encoding='utf-8') as f:
+            json.dump({'key': self.keys[stage], 'output': os.path.basename(filename)}, f)
+    
+    def load_fitted(self, stage, estimator):
+        """
+        Set the saved fitted attributes of a stage on its estimator.
+        """
+        with open(self._path(stage, 'fitted.pickle'), mode='rb') as f:
+            for name, value in pickle.load(f).items():
+                setattr(estimator, name, value)
+    
+    def load_output(self, stage):
+        """
+        Return the saved output of a stage.
+        """
+        with open(self._path(stage, 'json'), encoding='utf-8') as f:
+            filename = os.path.join(self.directory, json.load(f)['output'])
+        if filename.endswith('.npz'):
+            return sparse.load_npz(filename)
+        with open(filename, mode='rb') as f:
+            return pickle.load(f)
+
+
+def fit(model, X, y, checkpoints, log=print):
+    """
+    Fit a pipeline (in place), resuming from the latest valid checkpoint.
+    
+    Required arguments:
+    model       -- pipeline (its steps may be wrapped by profiling.wrap())
+    X           -- training texts
+    y           -- their labels
+    checkpoints -- Checkpoints of the stages before the final estimator
+    
+    Optional keyword arguments:
+    log         -- function to report which stages are loaded and fitted with
+                   defaults to print
+    
+    Returns:
+    the input of the final estimator for the training texts
+    """
+    steps = model.steps[:-1]
+    # The longest run of valid checkpoints from the first stage.
+    n_valid = 0
+    while n_valid < len(steps) and checkpoints.valid(steps[n_valid][0]):
+        n_valid += 1
+    Xt = X
+    for i, (stage, step) in enumerate(steps):
+        estimator = getattr(step, 'estimator', step)
+        if i < n_valid:
+            checkpoints.load_fitted(stage, estimator)
+            if i == n_valid - 1:
+                Xt = checkpoints.load_output(stage)
+                log('[checkpoint] loaded', stage)
+            continue
+        Xt = step.fit_transform(Xt, y)
+        checkpoints.save(stage, estimator, Xt)
+        log('[checkpoint] saved', stage)
+    model.steps[-1][1].fit(Xt, y)
+    return Xt
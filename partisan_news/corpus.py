@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Read texts from the data files lazily, by index.
+
+Each data file (such as mainstream.txt) holds one text per line. \
+A Corpus records where in the file each text starts and ends, \
+saves that index next to the file (so an unchanged file is not scanned again), \
+and memory-maps the file, so a text is read and decoded only when it is needed.
+
+Corpus.view() returns a sequence of texts that can be indexed with an array of indices, \
+like a numpy array. scikit-learn's train_test_split() and cross_validate() \
+then split the corpus into views on the same files, rather than lists of copied strings.
+"""
+
+import mmap
+import os
+
+import numpy as np
+
+
+def index_filename(filename):
+    """
+    Return the name of the file to save the index of a data file in.
+    """
+    return os.path.splitext(filename)[0] + '.index.npz'
+
+
+def build_index(filename):
+    """
+    Return arrays of the byte offsets at which the texts in a file start and end.
+    
+    Each text is a non-empty line followed by a newline.
+    (The same texts as re.findall('.+(?=\\n+)', ...) finds.)
+    """
+    starts = []
+    ends = []
+    with open(filename, mode='rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            start = 0
+            while True:
+                end = mm.find(b'\n', start)
+                if end == -1:
+                    break
+                if end > start:
+                    starts.append(start)
+                    ends.append(end)
+                start = end + 1
+    return np.array(starts, dtype=np.int64), np.array(ends, dtype=np.int64)
+
+
+def load_index(filename):
+    """
+    Return the start and end offsets of the texts in a file.
+    
+    Uses the saved index if the file has not changed since it was saved, \
+    otherwise builds the index and saves it.
+    """
+    stat = os.stat(filename)
+    path = index_filename(filename)
+    try:
+        with np.load(path) as saved:
+            if saved['size'] == stat.st_size and saved['mtime_ns'] == stat.st_mtime_ns:
+                return saved['starts'], saved['ends']
+    except (OSError, KeyError, ValueError):
+        pass
+    starts, ends = build_index(filename)
+    np.savez(path, starts=starts, ends=ends,
+             size=stat.st_size, mtime_ns=stat.st_mtime_ns)
+    return starts, ends
+
+
+class Corpus:
+    """
+    The texts of several data files, one label per file.
+    
+    Attributes:
+    label_names -- list of the labels (the file names without '.txt')
+    codes       -- array of the label number of each text (int8)
+    labels      -- array of the label of each text
+                   (an object array referring to the strings in label_names)
+    """
+    
+    def __init__(self, filenames, encoding='utf-8'):
+        """
+        Required arguments:
+        filenames -- list of file names without the '.txt' extension
+                     also used as the labels for the texts in each file
+        
+        Optional keyword arguments:
+        encoding  -- encoding of the files
+                     defaults to 'utf-8'
+        """
+        self.label_names = list(filenames)
+        self.encoding = encoding
+        self._open()
+    
+    def _open(self):
+        self.files = []
+        self.maps = []
+        starts = []
+        ends = []
+        codes = []
+        for code, filename in enumerate(self.label_names):
+            file_starts, file_ends = load_index(filename + '.txt')
+            f = open(filename + '.txt', mode='rb')
+            self.files.append(f)
+            self.maps.append(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                             if len(file_starts) else b'')
+            starts.append(file_starts)
+            ends.append(file_ends)
+            codes.append(np.full(len(file_starts), code, dtype=np.int8))
+        self.starts = np.concatenate(starts)
+        self.ends = np.concatenate(ends)
+        self.codes = np.concatenate(codes)
+        self.labels = np.array(self.label_names, dtype=object)[self.codes]
+    
+    def __getstate__(self):
+        """
+        Pickle only the file names; the files are opened again when unpickled.
+        """
+        return {'label_names': self.label_names, 'encoding': self.encoding}
+    
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._open()
+    
+    def __deepcopy__(self, memo):
+        """
+        Copies of a corpus share the same open files.
+        """
+        return self
+    
+    def __len__(self):
+        return len(self.starts)
+    
+    def __getitem__(self, i):
+        """
+        Return the text with index i.
+        """
+        mm = self.maps[self.codes[i]]
+        return mm[self.starts[i]:self.ends[i]].decode(self.encoding)
+    
+    def view(self, indices=None):
+        """
+        Return a TextView of some of the texts (or all of them).
+        """
+        if indices is None:
+            indices = np.arange(len(self))
+        return TextView(self, indices)
+    
+    def close(self):
+        """
+        Close the data files.
+        """
+        for mm in self.maps:
+            if isinstance(mm, mmap.mmap):
+                mm.close()
+        for f in self.files:
+            f.close()
+
+
+class TextView:
+    """
+    A sequence of texts from a Corpus, read when they are accessed.
+    
+    Indexing with an integer returns a text.
+    Indexing with an array of indices, a boolean mask, or a slice returns another TextView.
+    """
+    
+    def __init__(self, corpus, indices):
+        """
+        Required arguments:
+        corpus  -- Corpus the texts come from
+        indices -- array of the indices of the texts in the corpus
+        """
+        self.corpus = corpus
+        self.indices = np.asarray(indices)
+    
+    @property
+    def shape(self):
+        # Lets scikit-learn index a view like an array.
+        return (len(self.indices),)
+    
+    def __len__(self):
+        return len(self.indices)
+    
+    def __getitem__(self, key):
+        if isinstance(key, tuple):
+            # scikit-learn indexes arrays as array[key, ...].
+            key = key[0]
+        if isinstance(key, (int, np.integer)):
+            return self.corpus[self.indices[key]]
+        return TextView(self.corpus, self.indices[key])
+    
+    def __iter__(self):
+        for i in self.indices:
+            yield self.corpus[i]
+    
+    def __repr__(self):
+        return '<TextView of {} texts>'.format(len(self))
+
+
+if __name__ == '__main__':
+    
+    from collections import Counter
+    import re
+    
+    filenames = ['mainstream', 'partisan']
+    corpus = Corpus(filenames)
+    print('{} texts: {}'.format(len(corpus), dict(Counter(corpus.labels))))
+    
+    # Check that the texts are the same as with the regular expression.
+    texts = []
+    for filename in filenames:
+        texts.extend(re.findall('.+(?=\n+)', open(filename+'.txt', encoding='utf-8').read()))
+    print('same texts as re.findall():', texts == list(corpus.view()))
+    
+    # Views can be split like arrays.
+    view = corpus.view()[np.array([0, -1])]
+    print(view, corpus.labels[[0, -1]])
@@ -2,68 +2,196 @@
 # -*- coding: utf-8 -*-
 """
 A script to download and process the BuzzFeed-Webis fake news corpus.
+
+The archive is downloaded into a local cache with fetch.py \
+(resuming an interrupted download, and not downloading it again if it has not changed), \
+streamed to disk in chunks, \
+and the XML files are read from it as they are, without extracting them. \
+Only the orientation and main text of each article are parsed, incrementally, \
+in a pool of processes. Each text file is opened once and written through a buffer. \
+The text files are not written again if the archive has not changed.
+
+Run as a script, with the web address of the archive or a local copy of it:
+python download.py
+python download.py articles.zip
 """
 
-from glob import glob
-from os import path
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import contextlib
+import json
+import os
+from xml.etree import ElementTree
 import zipfile
 
-from bs4 import BeautifulSoup
-import requests
-
-
-#%% Download
-
-# Web address.
-url = 'https://zenodo.org/record/1239675/files/'
-zipfilename = 'articles.zip'
-
-# Retreive.
-print('retrieving {} from {}'.format(zipfilename, url))
-r = requests.get(url + zipfilename)
-print('{}: {}'.format(r.status_code, r.reason))
-
-# Write to local file.
-with open(zipfilename, mode='wb') as f:
-    f.write(r.content)
-
-
-#%% Extract
-
-# Unzip.
-print('extracting')
-with zipfile.ZipFile(zipfilename) as zf:
-    zf.extractall()
-
-# Get list of files.
-subfolder = 'articles'
-xmlfilenames = glob(path.join(subfolder, '*.xml'))
-print('{} files extracted'.format(len(xmlfilenames)))
-
-
-#%% Convert to plain text
-
-# Open new text files.
-output_encoding = 'utf-8'
-open('mainstream.txt', mode='w', encoding=output_encoding)
-open('partisan.txt', mode='w', encoding=output_encoding)
-
-# Map them to the orientation labels in the xml files.
-mapping = {'mainstream': 'mainstream.txt',
-           'right': 'partisan.txt',
-           'left': 'partisan.txt'}
-
-# Read the body text of each xml file into the relevant text file.
-print('writing to text files')
-n_texts = 0
-for xmlfilename in xmlfilenames:
-    contents = BeautifulSoup(open(xmlfilename, encoding='utf-8').read(), features='lxml')
-    orientation = contents.find('orientation').get_text()
-    text = contents.find('maintext').get_text()
-    if text and text != 'The document has moved here.':
-        with open(mapping[orientation], mode='a', encoding=output_encoding) as f:
-            f.write(text + '\n')
-        n_texts += 1
+import fetch
+
+
+# The elements of an article to read (lower case: the XML has <mainText>).
+FIELDS = ('orientation', 'maintext')
+
+# Record of the archive the text files were last written from.
+STAMP_FILENAME = 'download.json'
+
+
+def parse_article(f, chunk_size=2**14):
+    """
+    Return a dictionary of the text of the orientation and maintext elements \
+    of an XML file object, reading only as far as needed to find them.
+    
+    Falls back on BeautifulSoup for files that are not well-formed XML.
+    """
+    parser = ElementTree.XMLPullParser(events=('end',))
+    fields = {}
+    try:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            parser.feed(chunk)
+            for event, element in parser.read_events():
+                # XML tags are case-sensitive, the names in FIELDS are not.
+                tag = element.tag.lower()
+                if tag in FIELDS:
+                    fields[tag] = ''.join(element.itertext())
+                    if len(fields) == len(FIELDS):
+                        return fields
+    except ElementTree.ParseError:
+        f.seek(0)
+        return parse_html(f.read())
+    return fields
+
+
+def parse_html(contents):
+    """
+    Return a dictionary of the text of the orientation and maintext elements \
+    of the contents of a file that is not well-formed XML.
+    """
+    from bs4 import BeautifulSoup
+    soup = BeautifulSoup(contents, features='lxml')
+    return {field: soup.find(field).get_text() for field in FIELDS if soup.find(field)}
+
+
+# The archive open in a worker process.
+# Opened once per process by _init_worker(), rather than for each article.
+_archive = None
+
+
+def _init_worker(zipfilename):
+    global _archive
+    _archive = zipfile.ZipFile(zipfilename)
+
+
+def read_article(name):
+    """
+    Return the orientation and main text of an article in the worker's archive.
+    """
+    with _archive.open(name) as f:
+        fields = parse_article(f)
+    return fields.get('orientation'), fields.get('maintext')
+
+
+def xml_names(zipfilename):
+    """
+    Return the names of the XML files in a zip file.
+    """
+    with zipfile.ZipFile(zipfilename) as zf:
+        return [name for name in zf.namelist() if name.endswith('.xml')]
+
+
+def convert(zipfilename, mapping, encoding='utf-8', n_jobs=None, chunksize=64):
+    """
+    Write the main text of each article in an archive to the text file of its orientation, \
+    one text per line.
+    
+    Required arguments:
+    zipfilename -- the archive of XML files
+    mapping     -- dictionary from orientations to text files
+    
+    Optional keyword arguments:
+    encoding    -- encoding of the text files
+                   defaults to 'utf-8'
+    n_jobs      -- number of processes to parse the articles in
+                   defaults to None (the number of CPUs)
+    chunksize   -- number of articles to send to a process at a time
+                   defaults to 64
+    
+    Returns:
+    the number of texts written
+    """
+    names = xml_names(zipfilename)
+    print('{} files in {}'.format(len(names), zipfilename))
+    if n_jobs is None:
+        n_jobs = os.cpu_count() or 1
+    
+    n_texts = 0
+    with contextlib.ExitStack() as stack:
+        outputs = {filename: stack.enter_context(open(filename, mode='w', encoding=encoding,
+                                                      buffering=2**20))
+                   for filename in set(mapping.values())}
+        if n_jobs == 1:
+            _init_worker(zipfilename)
+            articles = map(read_article, names)
+        else:
+            executor = stack.enter_context(ProcessPoolExecutor(n_jobs, initializer=_init_worker,
+                                                               initargs=(zipfilename,)))
+            articles = executor.map(read_article, names, chunksize=chunksize)
+        for name, (orientation, text) in zip(names, articles):
+            if orientation not in mapping:
+                print('{} has no known orientation ({})!'.format(name, orientation))
+            elif text and text != 'The document has moved here.':
+                outputs[mapping[orientation]].write(text + '\n')
+                n_texts += 1
+            else:
+                print('{} empty!'.format(name))
+    return n_texts
+
+
+def convert_record(filename):
+    """
+    Return the record of the archive the text files were last written from \
+    (an empty dictionary if there is none).
+    """
+    try:
+        with open(filename, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+if __name__ == '__main__':
+    
+    parser = argparse.ArgumentParser(description='Download and convert the corpus.')
+    parser.add_argument('source', nargs='?',
+                        default='https://zenodo.org/record/1239675/files/articles.zip',
+                        help='web address or local copy of the archive')
+    parser.add_argument('--checksum',
+                        help='expected checksum of the archive, as <algorithm>:<hexadecimal>')
+    parser.add_argument('--n-jobs', type=int, default=None,
+                        help='number of processes to parse the articles in')
+    args = parser.parse_args()
+    
+    # Download, unless the archive is a local file.
+    # (Only if it has changed since the last download.)
+    if os.path.exists(args.source):
+        zipfilename = args.source
+        checksum = fetch.file_checksum(zipfilename)
+    else:
+        print('retrieving {}'.format(args.source))
+        zipfilename, record, downloaded = fetch.fetch(args.source, checksum=args.checksum)
+        print('downloaded' if downloaded else 'cached copy is up to date')
+        checksum = record['sha256']
+    
+    # Map the orientation labels in the xml files to text files.
+    mapping = {'mainstream': 'mainstream.txt',
+               'right': 'partisan.txt',
+               'left': 'partisan.txt'}
+    
+    # Convert the archive, unless the text files are from this same archive.
+    if (convert_record(STAMP_FILENAME).get('sha256') == checksum
+            and all(os.path.exists(filename) for filename in mapping.values())):
+        print('text files are up to date')
     else:
-        print('{} empty!'.format(xmlfilename))
-print('{} texts written'.format(n_texts))
+        # Read the body text of each xml file into the relevant text file.
+        print('writing to text files')
+        n_texts = convert(zipfilename, mapping, n_jobs=args.n_jobs)
+        print('{} texts written'.format(n_texts))
+        with open(STAMP_FILENAME, mode='w', encoding='utf-8') as f:
+            json.dump({'sha256': checksum, 'n_texts': n_texts}, f)
@@ -0,0 +1,325 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Evaluate the partisanship scores of labelled texts, with bootstrap confidence intervals.
+
+The scores are sorted once. The true and false positives at every threshold \
+(every distinct score) are then cumulative sums over the sorted labels, \
+and precision, recall, F1, the false positive rate and ROC AUC follow from them.
+
+A bootstrap resample of the texts is a vector of how many times each text is drawn. \
+The counts for many resamples at once form a matrix, \
+so the true and false positives of all of them are cumulative sums along its rows, \
+and each metric is computed for all the resamples together in NumPy, without a loop per resample. \
+Batches of resamples, as many as fit in a fixed amount of memory, are spread across processes.
+
+report() writes the results as CSV tables:
+the metrics at every threshold, \
+their confidence intervals at a grid of thresholds, \
+and a summary of accuracy, precision, recall and F1 at one threshold and ROC AUC.
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+import csv
+import os
+import warnings
+
+import numpy as np
+
+
+# Names of the metrics at a threshold, and of the summary metrics.
+CURVE_METRICS = ['precision', 'recall', 'f1', 'fpr']
+SUMMARY_METRICS = ['accuracy', 'precision', 'recall', 'f1', 'roc_auc']
+
+# Bytes used by resample() for each text in each resample, at its peak
+# (about ten int64 arrays of resamples x texts).
+RESAMPLE_BYTES_PER_TEXT = 80
+
+
+def sort_scores(labels, scores):
+    """
+    Sort texts by score, highest first.
+    
+    Required arguments:
+    labels -- array of whether each text is positive (True or 1) or not
+    scores -- array of their scores (for example P(partisan))
+    
+    Returns:
+    array of the distinct scores, highest first
+    array of the positions in the sorted texts where each distinct score starts
+    array of the sorted labels (as 0 and 1)
+    array of the order of the texts
+    """
+    scores = np.asarray(scores)
+    order = np.argsort(-scores, kind='stable')
+    sorted_scores = scores[order]
+    starts = np.flatnonzero(np.r_[True, sorted_scores[1:] != sorted_scores[:-1]])
+    return sorted_scores[starts], starts, np.asarray(labels, dtype=np.int64)[order], order
+
+
+def positive_counts(positive, starts, weights=None):
+    """
+    Return the true and false positives at every threshold.
+    
+    Required arguments:
+    positive -- array of the labels of the sorted texts (0 and 1), from sort_scores()
+    starts   -- array of the starts of the distinct scores, from sort_scores()
+    
+    Optional keyword arguments:
+    weights  -- array (resamples x texts) of the number of times each sorted text is counted
+                defaults to None (each text once)
+    
+    Returns:
+    arrays (resamples x thresholds + 1, or thresholds + 1 without weights) \
+    of the true and the false positives when predicting the texts \
+    with at least each distinct score as positive, after a column of 0 (no texts)
+    """
+    if weights is None:
+        weights = np.ones(len(positive), dtype=np.int64)
+    true = np.add.reduceat(weights * positive, starts, axis=-1)
+    false = np.add.reduceat(weights * (1 - positive), starts, axis=-1)
+    zero = np.zeros(true.shape[:-1] + (1,), dtype=true.dtype)
+    return (np.cumsum(np.concatenate([zero, true], axis=-1), axis=-1),
+            np.cumsum(np.concatenate([zero, false], axis=-1), axis=-1))
+
+
+def metrics(tp, fp):
+    """
+    Return a dictionary of precision, recall, F1 and false positive rate \
+    for true and false positive counts from positive_counts() (or columns of them).
+    The totals of positives and negatives are in the last column of the counts.
+    
+    Undefined values (such as precision with no texts predicted positive) are nan.
+    """
+    n_positive = tp[..., -1:]
+    n_negative = fp[..., -1:]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return {'precision': tp / (tp + fp),
+                'recall': tp / n_positive,
+                'f1': 2 * tp / (tp + fp + n_positive),
+                'fpr': fp / n_negative}
+
+
+def roc_auc(tp, fp):
+    """
+    Return the area under the ROC curve \
+    for true and false positive counts from positive_counts().
+    (Tied scores count half, as in scikit-learn's roc_auc_score().)
+    """
+    area = np.sum(np.diff(fp, axis=-1) * (tp[..., 1:] + tp[..., :-1]), axis=-1) / 2
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return area / (tp[..., -1] * fp[..., -1])
+
+
+def threshold_columns(distinct_scores, thresholds):
+    """
+    Return the columns of the counts from positive_counts() \
+    for predicting the texts with at least each of some thresholds as positive.
+    """
+    return np.searchsorted(-distinct_scores, -np.asarray(thresholds), side='right')
+
+
+def summary(tp, fp, column):
+    """
+    Return a dictionary of accuracy, precision, recall and F1 at one column of the counts, \
+    and ROC AUC.
+    """
+    n = tp[..., -1] + fp[..., -1]
+    # Only the column and the totals, so that the results are not views of whole rows of counts.
+    at_threshold = metrics(tp[..., [column, -1]], fp[..., [column, -1]])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        scores = {'accuracy': (tp[..., column] + fp[..., -1] - fp[..., column]) / n}
+    scores.update({name: at_threshold[name][..., 0]
+                   for name in ['precision', 'recall', 'f1']})
+    scores['roc_auc'] = roc_auc(tp, fp)
+    return scores
+
+
+def resample(positive, starts, columns, threshold_column, n_resamples, seed):
+    """
+    Compute the metrics for a batch of bootstrap resamples.
+    
+    Required arguments:
+    positive         -- array of the labels of the sorted texts, from sort_scores()
+    starts           -- array of the starts of the distinct scores, from sort_scores()
+    columns          -- array of the columns of the counts at a grid of thresholds
+    threshold_column -- column of the counts at the threshold for the summary metrics
+    n_resamples      -- number of resamples
+    seed             -- seed of the random number generator (such as a numpy SeedSequence)
+    
+    Returns:
+    dictionary from the names of the summary metrics to arrays (resamples) \
+    and from the names of the curve metrics to arrays (resamples x grid thresholds)
+    """
+    rng = np.random.default_rng(seed)
+    n = len(positive)
+    # Count how many times each text is drawn in each resample.
+    draws = rng.integers(n, size=(n_resamples, n)) + n * np.arange(n_resamples)[:, None]
+    weights = np.bincount(draws.ravel(), minlength=n_resamples * n).reshape(n_resamples, n)
+    tp, fp = positive_counts(positive, starts, weights)
+    samples = summary(tp, fp, threshold_column)
+    # Keep the totals as the last column, for the rates.
+    grid = metrics(tp[:, np.r_[columns, -1]], fp[:, np.r_[columns, -1]])
+    samples.update({'curve_' + name: values[:, :-1] for name, values in grid.items()})
+    return samples
+
+
+def bootstrap(labels, scores, n_resamples=2000, threshold=0.5, thresholds=None,
+              batch_bytes=2**24, n_jobs=None, random_state=0):
+    """
+    Return the metrics of bootstrap resamples of some texts.
+    
+    Required arguments:
+    labels       -- array of whether each text is positive (True or 1) or not
+    scores       -- array of their scores
+    
+    Optional keyword arguments:
+    n_resamples  -- number of resamples
+                    defaults to 2000
+    threshold    -- threshold for the summary metrics
+                    defaults to 0.5
+    thresholds   -- array of the thresholds to compute the curve metrics at
+                    defaults to None (0 to 1 in steps of 0.01)
+    batch_bytes  -- memory to use for a batch of resamples computed at a time (in each process), \
+                    so that there are fewer resamples in a batch the more texts there are
+                    defaults to 2**24 (16 MB)
+    n_jobs       -- number of processes
+                    defaults to None (the number of CPUs)
+    random_state -- seed of the resamples
+                    (the same seed gives the same resamples for any n_jobs, \
+                    though not for any batch_bytes)
+                    defaults to 0
+    
+    Returns:
+    dictionary from the names of the summary metrics to arrays (resamples) \
+    and from 'curve_' and the names of the curve metrics to arrays (resamples x thresholds)
+    """
+    if thresholds is None:
+        thresholds = np.linspace(0, 1, 101)
+    distinct_scores, starts, positive, _ = sort_scores(labels, scores)
+    columns = threshold_columns(distinct_scores, thresholds)
+    threshold_column = threshold_columns(distinct_scores, [threshold])[0]
+    batch_size = max(1, min(n_resamples, batch_bytes // (RESAMPLE_BYTES_PER_TEXT * len(positive))))
+    sizes = [min(batch_size, n_resamples - i) for i in range(0, n_resamples, batch_size)]
+    seeds = np.random.SeedSequence(random_state).spawn(len(sizes))
+    arguments = [[positive] * len(sizes), [starts] * len(sizes), [columns] * len(sizes),
+                 [threshold_column] * len(sizes), sizes, seeds]
+    if n_jobs is None:
+        n_jobs = os.cpu_count() or 1
+    if n_jobs == 1:
+        batches = list(map(resample, *arguments))
+    else:
+        with ProcessPoolExecutor(n_jobs) as executor:
+            batches = list(executor.map(resample, *arguments))
+    return {name: np.concatenate([batch[name] for batch in batches]) for name in batches[0]}
+
+
+def intervals(samples, confidence=0.95):
+    """
+    Return a dictionary from the names of metrics to the lower and upper percentiles \
+    of their bootstrap samples (ignoring resamples for which a metric is undefined).
+    """
+    tail = (1 - confidence) / 2 * 100
+    # Metrics undefined in every resample (such as precision above every score) stay nan.
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        return {name: np.nanpercentile(values, [tail, 100 - tail], axis=0)
+                for name, values in samples.items()}
+
+
+def write_table(filename, columns):
+    """
+    Write a dictionary from column names to sequences of values as a CSV file.
+    """
+    with open(filename, mode='w', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(columns)
+        writer.writerows(zip(*columns.values()))
+
+
+def report(labels, scores, prefix, threshold=0.5, n_resamples=2000, confidence=0.95,
+           n_jobs=None, random_state=0):
+    """
+    Evaluate some scores and write the results as CSV tables:
+    <prefix>_thresholds.csv (the metrics at every threshold),
+    <prefix>_intervals.csv (their confidence intervals at thresholds from 0 to 1 in steps of 0.01)
+    and <prefix>_summary.csv (the summary metrics at a threshold, with confidence intervals).
+    
+    Required arguments:
+    labels       -- array of whether each text is positive (True or 1) or not
+    scores       -- array of their scores
+    prefix       -- start of the names of the files to write
+    
+    Optional keyword arguments:
+    threshold    -- threshold for the summary metrics
+                    defaults to 0.5
+    n_resamples  -- number of bootstrap resamples
+                    defaults to 2000
+    confidence   -- confidence level of the intervals
+                    defaults to 0.95
+    n_jobs       -- number of processes for the resamples
+                    defaults to None (the number of CPUs)
+    random_state -- seed of the resamples
+                    defaults to 0
+    
+    Returns:
+    lines of the summary table (tab-separated)
+    """
+    distinct_scores, starts, positive, _ = sort_scores(labels, scores)
+    tp, fp = positive_counts(positive, starts)
+    curves = metrics(tp, fp)
+    # The first column (no texts predicted positive) is at a threshold above every score.
+    write_table(prefix + '_thresholds.csv',
+                dict({'threshold': np.r_[np.inf, distinct_scores], 'tp': tp, 'fp': fp},
+                     **curves))
+    
+    thresholds = np.linspace(0, 1, 101)
+    samples = bootstrap(labels, scores, n_resamples, threshold, thresholds,
+                        n_jobs=n_jobs, random_state=random_state)
+    bounds = intervals(samples, confidence)
+    columns = {'threshold': thresholds}
+    grid_columns = threshold_columns(distinct_scores, thresholds)
+    for name in CURVE_METRICS:
+        columns[name] = curves[name][grid_columns]
+        columns[name + '_lower'], columns[name + '_upper'] = bounds['curve_' + name]
+    write_table(prefix + '_intervals.csv', columns)
+    
+    estimates = summary(tp, fp, threshold_columns(distinct_scores, [threshold])[0])
+    columns = {'metric': SUMMARY_METRICS,
+               'estimate': [estimates[name] for name in SUMMARY_METRICS],
+               'lower': [bounds[name][0] for name in SUMMARY_METRICS],
+               'upper': [bounds[name][1] for name in SUMMARY_METRICS]}
+    write_table(prefix + '_summary.csv', columns)
+    return ['metric\testimate\t{:.0%} interval'.format(confidence)] + \
+           ['{}\t{:.3f}\t{:.3f}-{:.3f}'.format(*row) for row in zip(*columns.values())]
+
+
+if __name__ == '__main__':
+    
+    import argparse
+    from datetime import datetime
+    import time
+    
+    import corpus
+    import server
+    from settings import evaluation_settings
+    
+    parser = argparse.ArgumentParser(description='Evaluate a saved model on labelled data files.')
+    parser.add_argument('model', help='saved model folder or pickle file')
+    parser.add_argument('labels', nargs='+',
+                        help='labels of the data files to evaluate on (such as mainstream partisan)')
+    parser.add_argument('--positive', default='partisan', help='label of the positive class')
+    parser.add_argument('--output', default=datetime.now().strftime('%d_%b_%Y_%H%M'),
+                        help='start of the names of the tables to write')
+    args = parser.parse_args()
+    
+    model = server.load_model(args.model)
+    texts = corpus.Corpus(args.labels)
+    scores = model.predict_proba(texts.view())[:, list(model.classes_).index(args.positive)]
+    labels = np.asarray(texts.labels) == args.positive
+    
+    start = time.perf_counter()
+    lines = report(labels, scores, args.output, **evaluation_settings)
+    print(*lines, sep='\n')
+    print('{} resamples of {} texts in {:.1f} s'.format(
+        evaluation_settings['n_resamples'], len(labels), time.perf_counter() - start))
@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Explain the partisanship scores of many texts at once.
+
+The naive Bayes classifier scores a text by the sum over its features of \
+the feature's weight in the text times the log probability of the feature in each class. \
+So the contribution of a feature to a text's partisanship is its weight \
+times the difference between its log probability in the partisan class and in the other class.
+
+For a batch of texts, the contributions of all features to all texts are \
+the sparse product of the texts' feature matrix with a diagonal matrix of those differences. \
+The top contributions of each text are then found among its nonzero contributions alone \
+(one row of the sparse matrix): partitioned to find the k largest, and only those sorted.
+"""
+
+import numpy as np
+from scipy import sparse
+
+import memory
+
+
+class Explainer:
+    """
+    Find the features that contribute most to the partisanship of texts, \
+    alongside their scores.
+    """
+    
+    def __init__(self, model, positive_label='partisan'):
+        """
+        Required arguments:
+        model          -- fitted pipeline ending in a MultinomialNB classifier
+                          (its steps may be wrapped by profiling.wrap())
+        
+        Optional keyword arguments:
+        positive_label -- label of the class to explain
+                          defaults to 'partisan'
+        """
+        self.model = model
+        self.positive_label = positive_label
+        steps = [getattr(step, 'estimator', step) for name, step in model.steps]
+        classifier = steps[-1]
+        self.positive = list(classifier.classes_).index(positive_label)
+        log_prob = np.asarray(classifier.feature_log_prob_)
+        # Against the most likely of the other classes (the other class, with two).
+        self.difference = (log_prob[self.positive]
+                           - np.delete(log_prob, self.positive, axis=0).max(axis=0))
+        self.vocabulary = steps[1].vocabulary_
+        self.support = steps[-2].get_support()
+        self._names = None
+    
+    @property
+    def names(self):
+        """
+        Array of the names of the selected features (built the first time it is needed).
+        """
+        if self._names is None:
+            selected = memory.FeatureNames(self.vocabulary)[self.support]
+            self._names = np.array(list(selected) + [''], dtype=object)
+        return self._names
+    
+    def transform(self, texts):
+        """
+        Return the matrix of selected features of some texts (the classifier's input).
+        """
+        X = texts
+        for name, step in self.model.steps[:-1]:
+            X = step.transform(X)
+        return X
+    
+    def contributions(self, X):
+        """
+        Return the sparse matrix of the contribution of each selected feature to each text.
+        """
+        # The product with the diagonal matrix of differences scales each column, \
+        # done directly on the nonzero values.
+        contributions = sparse.csr_matrix(X, copy=True)
+        contributions.data *= self.difference[contributions.indices]
+        contributions.eliminate_zeros()
+        return contributions
+    
+    def top(self, X, k=10):
+        """
+        Return the top k contributions to each text's partisanship.
+        
+        Required arguments:
+        X -- matrix of selected features of the texts (from Explainer.transform())
+        
+        Optional keyword arguments:
+        k -- number of features per text
+             defaults to 10
+        
+        Returns:
+        array (texts x k) of the column numbers of the features, largest contribution first
+        (-1 where a text has fewer than k features)
+        array (texts x k) of their contributions (0 where a text has fewer than k features)
+        """
+        contributions = self.contributions(X)
+        n_texts = contributions.shape[0]
+        columns = np.full((n_texts, k), -1, dtype=np.int64)
+        values = np.zeros((n_texts, k), dtype=contributions.dtype)
+        # For each text, partition its contributions to find the k largest,
+        # and sort only those. (Negated, so that the largest come first.)
+        negated = -contributions.data
+        indptr = contributions.indptr.tolist()
+        best = []
+        for start, end in zip(indptr[:-1], indptr[1:]):
+            row = negated[start:end]
+            if end - start > k:
+                order = row.argpartition(k - 1)[:k]
+                order = order[row[order].argsort(kind='stable')]
+            else:
+                order = row.argsort(kind='stable')
+            best.append(order + start)
+        best = np.concatenate(best) if best else np.zeros(0, dtype=np.int64)
+        # The rank of each of them within its text.
+        counts = np.minimum(np.diff(contributions.indptr), k)
+        rows = np.repeat(np.arange(n_texts), counts)
+        ranks = np.arange(len(best)) - np.repeat(np.cumsum(counts) - counts, counts)
+        columns[rows, ranks] = contributions.indices[best]
+        values[rows, ranks] = contributions.data[best]
+        return columns, values
+    
+    def explain(self, texts, k=10):
+        """
+        Score some texts and find the top k features contributing to their partisanship.
+        
+        Returns:
+        array of P(partisan) for each text
+        array (texts x k) of the names of the top features ('' where there are fewer than k)
+        array (texts x k) of their contributions
+        """
+        X = self.transform(texts)
+        probs = self.model.steps[-1][1].predict_proba(X)[:, self.positive]
+        columns, values = self.top(X, k)
+        return probs, self.names[columns], values
+
+
+if __name__ == '__main__':
+    
+    import time
+    
+    import corpus
+    import server
+    from settings import model_directory
+    
+    # Explain the scores of all the texts with the saved model.
+    model = server.load_model(model_directory)
+    explainer = Explainer(model)
+    texts = list(corpus.Corpus(['mainstream', 'partisan']).view())
+    explainer.names
+    # Tag once first, so that both are timed with the same (cached) tagging.
+    X = explainer.transform(texts)
+    
+    start = time.perf_counter()
+    probs = model.predict_proba(texts)
+    predict_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    probs, names, contributions = explainer.explain(texts, k=10)
+    explain_seconds = time.perf_counter() - start
+    print('predict_proba: {:.0f} texts/sec, explain with top 10 features: {:.0f} texts/sec'.format(
+        len(texts) / predict_seconds, len(texts) / explain_seconds))
+    
+    # Of the selected features alone.
+    classifier = model.steps[-1][1]
+    start = time.perf_counter()
+    classifier.predict_proba(X)
+    predict_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    explainer.top(X, k=10)
+    explain_seconds = time.perf_counter() - start
+    print('from the selected features: {:.1f} ms and {:.1f} ms for {} texts'.format(
+        predict_seconds * 1000, explain_seconds * 1000, len(texts)))
+    
+    for i in [0, -1]:
+        print('\nP(partisan) = {:.2f}'.format(probs[i]))
+        print(*['{}\t{:+.3f}'.format(*pair) for pair in zip(names[i], contributions[i])], sep='\n')
@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+A fast alternative to spacy for finding the lemma and part of speech of each word.
+
+Texts are split into tokens with a regular expression \
+(roughly as spacy splits them, including clitics like "n't" and "'s"), \
+and each token is looked up in a lexicon: \
+a table of the most frequent lemma and part of speech that spacy gave each token \
+in a corpus. Tokens missing from the lexicon are taken to be their own lemma, \
+and to be proper nouns if capitalized, otherwise nouns.
+
+Building the lexicon needs spacy (with its English model), but only once. \
+Run as a script to build it from the training texts of mainstream.txt and partisan.txt \
+(the same split as partisan_news.py, so the held-out texts stay unseen), \
+and report how many tokens of the held-out texts are missing from it.
+"""
+
+from collections import Counter, defaultdict
+import hashlib
+import json
+import re
+
+
+# File the lexicon is saved in.
+LEXICON_FILENAME = 'lexicon.json'
+
+# Regular expression for a token:
+# an abbreviation with dots (like U.S.),
+# the stem of a word with a "n't" clitic, the clitic itself, other clitics (like "'s"),
+# a word (letters, digits and underscores),
+# or any other single non-space character (punctuation, hyphens).
+TOKEN_RE = re.compile(r"(?:[a-z]\.){2,}|\w+(?=n['’]t\b)|n['’]t\b|['’](?:s|re|ve|ll|d|m)\b|\w+|[^\w\s]",
+                      re.IGNORECASE)
+
+# The lexicon.
+# Loaded by get_lexicon() the first time it is needed.
+lexicon = None
+
+
+def tokenize(text):
+    """
+    Return a list of the tokens in a text.
+    """
+    return TOKEN_RE.findall(text)
+
+
+def guess(token):
+    """
+    Return a (lemma, part of speech) pair for a token missing from the lexicon.
+    """
+    if token[0].isupper():
+        return token, 'PROPN'
+    if token[0].isalpha():
+        return token, 'NOUN'
+    if token.isdigit():
+        return token, 'NUM'
+    return token, 'PUNCT'
+
+
+def annotate(text, lexicon):
+    """
+    Return a list of (lemma, part of speech) pairs for a text.
+    
+    Required arguments:
+    text    -- string to annotate
+    lexicon -- dictionary from tokens to (lemma, part of speech) pairs
+    """
+    annotations = []
+    for token in tokenize(text):
+        annotation = lexicon.get(token) or lexicon.get(token.lower())
+        annotations.append(annotation or guess(token))
+    return annotations
+
+
+def unknown_rate(texts, lexicon):
+    """
+    Return the fraction of the tokens in some texts that are missing from a lexicon.
+    """
+    n_tokens = 0
+    n_unknown = 0
+    for text in texts:
+        for token in tokenize(text):
+            n_tokens += 1
+            if token not in lexicon and token.lower() not in lexicon:
+                n_unknown += 1
+    return n_unknown / max(n_tokens, 1)
+
+
+def build_lexicon(annotated_tokens):
+    """
+    Return a lexicon from an iterable of (token, lemma, part of speech) triples.
+    Each token is mapped to its most frequent lemma and part of speech.
+    """
+    counts = defaultdict(Counter)
+    for token, lemma, pos in annotated_tokens:
+        counts[token][(lemma, pos)] += 1
+    return {token: counter.most_common(1)[0][0] for token, counter in counts.items()}
+
+
+def lexicon_from_texts(texts, parameters, batch_size=50, n_process=1):
+    """
+    Return a lexicon built by tagging some texts with spacy.
+    
+    Required arguments:
+    texts      -- iterable of raw texts
+    parameters -- dictionary of preprocessing parameters
+                  (the texts are cleaned with preprocessing.clean() first)
+    
+    Optional keyword arguments:
+    batch_size -- number of texts per batch sent to spacy
+                  defaults to 50
+    n_process  -- number of processes for spacy to use
+                  defaults to 1
+    """
+    import preprocessing
+    cleaned = (preprocessing.clean(text, parameters) for text in texts)
+    docs = preprocessing.get_nlp().pipe(cleaned, batch_size=batch_size, n_process=n_process)
+    return build_lexicon((token.text, token.lemma_, token.pos_)
+                         for doc in docs for token in doc)
+
+
+def save_lexicon(lexicon, filename=LEXICON_FILENAME):
+    """
+    Save a lexicon to a JSON file.
+    """
+    with open(filename, mode='w', encoding='utf-8') as f:
+        json.dump(lexicon, f, ensure_ascii=False)
+
+
+def load_lexicon(filename=LEXICON_FILENAME):
+    """
+    Return a lexicon saved with save_lexicon().
+    """
+    with open(filename, encoding='utf-8') as f:
+        return {token: tuple(annotation) for token, annotation in json.load(f).items()}
+
+
+def lexicon_hash(filename=LEXICON_FILENAME):
+    """
+    Return a hash of the contents of a saved lexicon, \
+    to include in the keys of cached results tagged with it.
+    """
+    try:
+        with open(filename, mode='rb') as f:
+            return hashlib.sha256(f.read()).hexdigest()
+    except FileNotFoundError:
+        raise FileNotFoundError('no lexicon in {}: run fast_tagging.py to build it'
+                                .format(filename)) from None
+
+
+def get_lexicon():
+    """
+    Return the lexicon, loading it from LEXICON_FILENAME if necessary.
+    """
+    global lexicon
+    if lexicon is None:
+        try:
+            lexicon = load_lexicon()
+        except FileNotFoundError:
+            raise FileNotFoundError('no lexicon in {}: run fast_tagging.py to build it'
+                                    .format(LEXICON_FILENAME)) from None
+    return lexicon
+
+
+if __name__ == '__main__':
+    
+    from sklearn.model_selection import train_test_split
+    
+    import corpus
+    import preprocessing
+    from settings import parameters, tagger_settings
+    
+    # Tag the training texts with spacy, cleaned as for training.
+    # (The same split as partisan_news.py: the held-out texts must not be in the lexicon.)
+    documents = corpus.Corpus(['mainstream', 'partisan'])
+    train_items, test_items, train_labels, test_labels = train_test_split(
+        documents.view(), documents.labels, stratify=documents.labels, random_state=0)
+    lexicon = lexicon_from_texts(train_items, parameters, **tagger_settings)
+    save_lexicon(lexicon)
+    print('{} tokens saved in {}'.format(len(lexicon), LEXICON_FILENAME))
+    cleaned = (preprocessing.clean(text, parameters) for text in test_items)
+    print('{:.2%} of the tokens of the held-out texts are not in it'.format(
+        unknown_rate(cleaned, lexicon)))
@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Download files into a local cache, resuming interrupted downloads.
+
+A downloaded file is kept in the cache folder with a JSON record \
+of its web address, its ETag and Last-Modified headers, its size and its SHA-256 checksum. \
+Fetching the same address again sends a conditional request \
+(If-None-Match and If-Modified-Since), and if the server answers 304 Not Modified \
+the cached copy is used without downloading anything.
+
+An interrupted download is kept as a .part file. The next fetch asks only for the rest of it \
+(a Range request), with If-Range so that if the file has changed on the server since, \
+the server sends the whole new file instead.
+
+A download replaces the cached copy only after it is checked against the size \
+the server reported and, if one is given, against an expected checksum.
+"""
+
+import hashlib
+import json
+import os
+from urllib.parse import urlparse
+
+import requests
+
+import cache
+
+
+def file_checksum(filename, algorithm='sha256', chunk_size=2**20):
+    """
+    Return the hexadecimal checksum of a file, reading it in chunks.
+    """
+    digest = hashlib.new(algorithm)
+    with open(filename, mode='rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _load_record(filename):
+    try:
+        with open(filename, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_record(filename, record):
+    with open(filename + '.tmp', mode='w', encoding='utf-8') as f:
+        json.dump(record, f, indent=1)
+    os.replace(filename + '.tmp', filename)
+
+
+def cache_path(url, directory='.download_cache'):
+    """
+    Return the file in the cache folder for a web address
+    (its key and the file name in the address).
+    """
+    name = os.path.basename(urlparse(url).path) or 'download'
+    return os.path.join(directory, '{}_{}'.format(cache.hash_parameters({'url': url})[:16], name))
+
+
+def fetch(url, directory='.download_cache', checksum=None, chunk_size=2**20, timeout=60):
+    """
+    Return a cached copy of a file on the web, downloading it only if it has changed.
+    
+    Required arguments:
+    url        -- web address of the file
+    
+    Optional keyword arguments:
+    directory  -- cache folder (created if necessary)
+                  defaults to '.download_cache'
+    checksum   -- expected checksum of the file, as '<algorithm>:<hexadecimal>' \
+                  (for example 'md5:0a1b...', any algorithm of hashlib)
+                  defaults to None (check only the size)
+    chunk_size -- number of bytes to write at a time
+                  defaults to 2**20
+    timeout    -- seconds to wait for the server
+                  defaults to 60
+    
+    Returns:
+    the name of the cached file
+    its record (dictionary of url, etag, last_modified, size and sha256)
+    whether it was downloaded (False if the cached copy was still up to date)
+    
+    Raises ValueError if the downloaded file has the wrong size or checksum \
+    (the download is then discarded).
+    """
+    os.makedirs(directory, exist_ok=True)
+    path = cache_path(url, directory)
+    part = path + '.part'
+    record = _load_record(path + '.json')
+    part_record = _load_record(part + '.json')
+    if record and checksum and record.get('checksum') != checksum:
+        record = {}
+    
+    # Ask for the bytes of the file itself, not compressed for the transfer
+    # (so that the cached copy, its size and any Range refer to the file).
+    headers = {'Accept-Encoding': 'identity'}
+    if record and os.path.exists(path) and os.path.getsize(path) == record['size']:
+        if record.get('etag'):
+            headers['If-None-Match'] = record['etag']
+        if record.get('last_modified'):
+            headers['If-Modified-Since'] = record['last_modified']
+    offset = os.path.getsize(part) if os.path.exists(part) else 0
+    validator = part_record.get('etag') or part_record.get('last_modified')
+    if offset and validator:
+        headers['Range'] = 'bytes={}-'.format(offset)
+        headers['If-Range'] = validator
+    
+    with requests.get(url, headers=headers, stream=True, timeout=timeout) as r:
+        if r.status_code == 304:
+            return path, record, False
+        if r.status_code == 416:
+            # The partial file is no use (for example the file on the server got shorter).
+            os.remove(part)
+            return fetch(url, directory, checksum, chunk_size, timeout)
+        r.raise_for_status()
+        if r.headers.get('Content-Encoding', 'identity') != 'identity':
+            raise ValueError('{} was sent with Content-Encoding {}'.format(
+                url, r.headers['Content-Encoding']))
+        if r.status_code != 206:
+            offset = 0
+        new_record = {'url': url,
+                      'etag': r.headers.get('ETag'),
+                      'last_modified': r.headers.get('Last-Modified')}
+        # Record the validators first, so an interrupted download can be resumed.
+        _save_record(part + '.json', new_record)
+        digests = {'sha256': hashlib.sha256()}
+        if checksum:
+            algorithm, expected = checksum.split(':', 1)
+            digests.setdefault(algorithm, hashlib.new(algorithm))
+        if offset:
+            with open(part, mode='rb') as f:
+                for chunk in iter(lambda: f.read(chunk_size), b''):
+                    for digest in digests.values():
+                        digest.update(chunk)
+        expected_size = r.headers.get('Content-Length')
+        if expected_size is not None:
+            expected_size = offset + int(expected_size)
+        with open(part, mode='ab' if offset else 'wb') as f:
+            # The bytes as sent (never compressed, given Accept-Encoding: identity).
+            for chunk in r.raw.stream(chunk_size, decode_content=False):
+                f.write(chunk)
+                for digest in digests.values():
+                    digest.update(chunk)
+    
+    size = os.path.getsize(part)
+    if expected_size is not None and size < expected_size:
+        # Interrupted: keep the partial file, to resume from.
+        raise ValueError('downloaded {} of {} bytes of {}'.format(size, expected_size, url))
+    if expected_size is not None and size != expected_size:
+        failed = 'size'
+    elif checksum and digests[algorithm].hexdigest() != expected:
+        failed = 'checksum'
+    else:
+        failed = None
+    if failed:
+        os.remove(part)
+        os.remove(part + '.json')
+        raise ValueError('{} failed its {} check'.format(url, failed))
+    new_record.update({'size': size,
+                       'sha256': digests['sha256'].hexdigest(),
+                       'checksum': checksum})
+    os.replace(part, path)
+    _save_record(path + '.json', new_record)
+    os.remove(part + '.json')
+    return path, new_record, True
@@ -0,0 +1,292 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Update a fitted partisan news model with new labelled texts, \
+without preprocessing the texts it was trained on again.
+
+Every fitted component of the model can be recomputed from a few sums over the texts:
+the document frequency of every term (vectorizer vocabulary and tf-idf weights), \
+the number of texts in each class, and the sum over the texts in each class \
+of each term's normalized frequency (chi2 scores and naive Bayes counts).
+A Statistics object keeps these sums for all terms, \
+including those too rare or too common to be features yet.
+
+update() tags only the new texts, adds them to the sums, \
+and recomputes the vocabulary, idf, selected features and naive Bayes counts.
+The cost depends on the number of new texts (and the size of the vocabulary), \
+not on the number of texts already in the model.
+
+Statistics built from the training texts reproduce the fitted model exactly. \
+After updates the model is very close to one refitted on all the texts, but not identical: \
+each text's tf-idf vector is normalized with the idf of the time it was added.
+
+Run as a script to update the model saved by partisan_news.py with the texts of a file.
+"""
+
+import json
+import os
+
+import numpy as np
+from scipy import sparse, special
+
+
+class Statistics:
+    """
+    Sums over the texts a model is trained on.
+    
+    Attributes:
+    classes     -- list of the class labels, in the classifier's order
+    terms       -- list of all the terms seen
+    df          -- array of the number of texts each term occurs in
+    class_docs  -- array of the number of texts in each class
+    class_sums  -- array (classes x terms) of the sum over the texts in each class \
+                   of each term's frequency divided by the norm of the text's tf-idf vector
+    """
+    
+    def __init__(self, classes):
+        """
+        Required arguments:
+        classes -- list of the class labels
+        """
+        self.classes = [str(c) for c in classes]
+        self.terms = []
+        self.index = {}
+        self.df = np.zeros(0, dtype=np.int64)
+        self.class_docs = np.zeros(len(self.classes), dtype=np.int64)
+        self.class_sums = np.zeros((len(self.classes), 0))
+    
+    @property
+    def n_docs(self):
+        return int(self.class_docs.sum())
+    
+    def count(self, features):
+        """
+        Return a sparse matrix of the term counts of some texts, \
+        adding any new terms to the statistics (with zero counts).
+        
+        Required arguments:
+        features -- list of lists of features, as returned by a preprocessing.Tagger
+        """
+        n_terms = len(self.terms)
+        rows, columns = [], []
+        for i, text_features in enumerate(features):
+            for feature in text_features:
+                j = self.index.get(feature)
+                if j is None:
+                    j = self.index[feature] = len(self.terms)
+                    self.terms.append(feature)
+                rows.append(i)
+                columns.append(j)
+        n_new = len(self.terms) - n_terms
+        if n_new:
+            self.df = np.concatenate([self.df, np.zeros(n_new, dtype=np.int64)])
+            self.class_sums = np.hstack([self.class_sums, np.zeros((len(self.classes), n_new))])
+        counts = sparse.csr_matrix((np.ones(len(rows)), (rows, columns)),
+                                   shape=(len(features), len(self.terms)))
+        counts.sum_duplicates()
+        return counts
+    
+    def add(self, counts, labels, vectorizer, transformer, vocabulary=None):
+        """
+        Add the counts of some texts to the statistics.
+        
+        Required arguments:
+        counts      -- sparse matrix of term counts from Statistics.count()
+        labels      -- their labels
+        vectorizer  -- CountVectorizer of the model (for min_df and max_df)
+        transformer -- TfidfTransformer of the model (for its settings)
+        
+        Optional keyword arguments:
+        vocabulary  -- boolean array of which terms are features when normalizing the texts
+                       defaults to None (the features after adding the texts)
+        """
+        codes = np.array([self.classes.index(str(label)) for label in labels])
+        self.df += np.bincount(counts.indices, minlength=counts.shape[1])
+        self.class_docs += np.bincount(codes, minlength=len(self.classes))
+        if vocabulary is None:
+            vocabulary = self.vocabulary_mask(vectorizer)
+        tf = counts.copy()
+        if transformer.sublinear_tf:
+            tf.data = np.log(tf.data) + 1
+        tfidf = tf @ sparse.diags(self.idf(transformer) * vocabulary)
+        if transformer.norm == 'l2':
+            norms = np.sqrt(np.asarray(tfidf.multiply(tfidf).sum(axis=1)).ravel())
+        elif transformer.norm == 'l1':
+            norms = np.asarray(abs(tfidf).sum(axis=1)).ravel()
+        else:
+            norms = np.ones(counts.shape[0])
+        norms[norms == 0] = 1
+        class_matrix = sparse.csr_matrix((1 / norms, (codes, np.arange(len(codes)))),
+                                         shape=(len(self.classes), len(codes)))
+        self.class_sums += (class_matrix @ tf).toarray()
+    
+    def vocabulary_mask(self, vectorizer):
+        """
+        Return a boolean array of which terms pass the vectorizer's min_df and max_df.
+        """
+        n_docs = self.n_docs
+        min_df, max_df = vectorizer.min_df, vectorizer.max_df
+        min_count = min_df if isinstance(min_df, (int, np.integer)) else min_df * n_docs
+        max_count = max_df if isinstance(max_df, (int, np.integer)) else max_df * n_docs
+        return (self.df >= min_count) & (self.df <= max_count)
+    
+    def idf(self, transformer):
+        """
+        Return the idf of every term, as computed by the transformer.
+        """
+        if not transformer.use_idf:
+            return np.ones(len(self.terms))
+        smooth = int(transformer.smooth_idf)
+        return np.log((self.n_docs + smooth) / (self.df + smooth)) + 1
+    
+    def save(self, directory):
+        """
+        Save the statistics in a folder (for example next to a saved model).
+        """
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, 'statistics_terms.json'), mode='w', encoding='utf-8') as f:
+            json.dump({'classes': self.classes, 'terms': self.terms}, f, ensure_ascii=False)
+        np.savez(os.path.join(directory, 'statistics.npz'),
+                 df=self.df, class_docs=self.class_docs, class_sums=self.class_sums)
+    
+    @classmethod
+    def load(cls, directory):
+        """
+        Return statistics saved with Statistics.save().
+        """
+        with open(os.path.join(directory, 'statistics_terms.json'), encoding='utf-8') as f:
+            saved = json.load(f)
+        statistics = cls(saved['classes'])
+        statistics.terms = saved['terms']
+        statistics.index = {term: i for i, term in enumerate(statistics.terms)}
+        with np.load(os.path.join(directory, 'statistics.npz')) as arrays:
+            statistics.df = arrays['df']
+            statistics.class_docs = arrays['class_docs']
+            statistics.class_sums = arrays['class_sums']
+        return statistics
+
+
+def _steps(model):
+    # The fitted components, without any profiling wrappers.
+    return [getattr(step, 'estimator', step) for name, step in model.steps]
+
+
+def build(model, features, labels):
+    """
+    Return the Statistics of the texts a model was fitted on.
+    
+    Required arguments:
+    model    -- pipeline fitted on the texts
+    features -- their lists of features (the output of the pipeline's tagger)
+    labels   -- their labels
+    """
+    tagger, vectorizer, transformer, feature_selecter, classifier = _steps(model)
+    statistics = Statistics(classifier.classes_)
+    counts = statistics.count(features)
+    # Normalize with the fitted vocabulary, as the transformer did.
+    vocabulary = np.zeros(len(statistics.terms), dtype=bool)
+    for term in vectorizer.vocabulary_:
+        vocabulary[statistics.index[term]] = True
+    statistics.add(counts, labels, vectorizer, transformer, vocabulary=vocabulary)
+    return statistics
+
+
+def chi2_from_sums(class_sums, class_docs):
+    """
+    Return the chi2 scores and p values of features from their sums in each class.
+    (The same as sklearn.feature_selection.chi2() on the texts.)
+    """
+    feature_sums = class_sums.sum(axis=0)
+    expected = np.outer(class_docs / class_docs.sum(), feature_sums)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        scores = ((class_sums - expected)**2 / expected).sum(axis=0)
+    return scores, special.chdtrc(len(class_docs) - 1, scores)
+
+
+def refit(model, statistics):
+    """
+    Recompute the fitted components of a model (in place) from statistics.
+    
+    The tagger is unchanged. The vectorizer gets the terms within min_df and max_df, \
+    the transformer their idf, the feature selecter their chi2 scores, \
+    and the classifier the sums of their tf-idf weights in each class.
+    """
+    tagger, vectorizer, transformer, feature_selecter, classifier = _steps(model)
+    
+    # Vocabulary in alphabetical order, as CountVectorizer sorts it.
+    mask = statistics.vocabulary_mask(vectorizer)
+    terms = np.array(statistics.terms, dtype=object)[mask]
+    order = np.argsort(terms)
+    columns = np.flatnonzero(mask)[order]
+    vectorizer.vocabulary_ = {term: i for i, term in enumerate(terms[order])}
+    
+    transformer.idf_ = statistics.idf(transformer)[columns]
+    transformer.n_features_in_ = len(columns)
+    
+    # Sums of the tf-idf weights of the texts in each class.
+    class_sums = statistics.class_sums[:, columns] * transformer.idf_
+    feature_selecter.__dict__.pop('support_mask_', None)
+    feature_selecter.scores_, feature_selecter.pvalues_ = chi2_from_sums(class_sums,
+                                                                         statistics.class_docs)
+    feature_selecter.n_features_in_ = len(columns)
+    support = feature_selecter.get_support()
+    
+    # As MultinomialNB.fit() computes them from the counts.
+    classifier.feature_count_ = class_sums[:, support]
+    classifier.class_count_ = statistics.class_docs.astype(float)
+    smoothed = classifier.feature_count_ + classifier.alpha
+    classifier.feature_log_prob_ = (np.log(smoothed)
+                                    - np.log(smoothed.sum(axis=1, keepdims=True)))
+    n_classes = len(statistics.classes)
+    if classifier.fit_prior:
+        classifier.class_log_prior_ = (np.log(classifier.class_count_)
+                                       - np.log(classifier.class_count_.sum()))
+    else:
+        classifier.class_log_prior_ = np.full(n_classes, -np.log(n_classes))
+    classifier.n_features_in_ = int(support.sum())
+    return model
+
+
+def update(model, statistics, texts, labels):
+    """
+    Update a fitted model (in place) with new labelled texts.
+    
+    Required arguments:
+    model      -- fitted pipeline of tag, vectorize, transform, select and classify steps
+    statistics -- its Statistics (from build() or Statistics.load()), updated too
+    texts      -- sequence of new raw texts
+    labels     -- their labels (each one of the model's classes)
+    
+    Returns:
+    the model
+    """
+    tagger, vectorizer, transformer, feature_selecter, classifier = _steps(model)
+    counts = statistics.count(tagger.transform(texts))
+    statistics.add(counts, labels, vectorizer, transformer)
+    return refit(model, statistics)
+
+
+if __name__ == '__main__':
+    
+    import argparse
+    
+    import artifact
+    import streaming
+    from settings import model_directory
+    
+    parser = argparse.ArgumentParser(description='Update the saved model with new texts.')
+    parser.add_argument('filename', help='file of new texts, one per line')
+    parser.add_argument('label', help='label of the texts (for example partisan)')
+    parser.add_argument('--model', default=model_directory, help='folder of the saved model')
+    args = parser.parse_args()
+    
+    meta = artifact.read_meta(args.model)
+    model = artifact.load(args.model, mmap_mode=None)
+    statistics = Statistics.load(args.model)
+    texts = list(streaming.read_texts(args.filename))
+    update(model, statistics, texts, [args.label] * len(texts))
+    # The saved model no longer matches the data files, so drop its key.
+    artifact.save(model, args.model, meta['parameters'])
+    statistics.save(args.model)
+    print('{} texts added, {} texts and {} features in the model'.format(
+        len(texts), statistics.n_docs, len(model.named_steps['vectorize'].vocabulary_)))
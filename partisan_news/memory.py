@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Reduce and report the memory used by the partisan news model.
+
+In compact mode, the vectorizer counts features as float32 values, \
+so the feature matrices of every stage hold float32 values \
+(half the size of the default float64 values) \
+with int32 indices (which scikit-learn already uses when they fit), \
+and the fitted arrays of the model are stored as float32 too.
+
+FeatureNames looks up the names of features in the vectorizer's vocabulary \
+only when they are needed, \
+rather than building an array of all of them (which for millions of ngrams \
+takes far more memory than the model itself).
+
+memory_report() breaks down the memory used by each stage: \
+its fitted attributes, and its output for some texts.
+"""
+
+import sys
+
+import numpy as np
+from scipy import sparse
+
+
+# Type of the values of the feature matrices in compact mode.
+COMPACT_DTYPE = np.float32
+
+
+def compact(model, stages=('vectorize', 'transform', 'classify')):
+    """
+    Store the fitted float arrays of some stages of a pipeline as float32, \
+    and copy their fitted dictionaries (in place).
+    
+    Not the scores of the feature selecter by default, \
+    since the selected features are recomputed from them, \
+    and rounding them could change which of them are tied.
+    
+    Copying a dictionary frees the space left by deleted items. \
+    (The vectorizer deletes the terms outside min_df and max_df from its vocabulary, \
+    which can leave the vocabulary many times larger than it needs to be.)
+    """
+    for name, step in model.steps:
+        if name not in stages:
+            continue
+        estimator = getattr(step, 'estimator', step)
+        for attribute, value in vars(estimator).items():
+            if (attribute.endswith('_') and isinstance(value, np.ndarray)
+                    and value.dtype == np.float64):
+                setattr(estimator, attribute, value.astype(COMPACT_DTYPE))
+            elif attribute.endswith('_') and isinstance(value, dict):
+                setattr(estimator, attribute, dict(value))
+    return model
+
+
+class FeatureNames:
+    """
+    The names of some of the features of a vectorizer, looked up when they are needed.
+    
+    Indexing with an integer returns a name.
+    Indexing with a slice, an array of indices or a boolean mask returns another FeatureNames.
+    Iterating returns the names.
+    """
+    
+    def __init__(self, vocabulary, columns=None, _lookup=None):
+        """
+        Required arguments:
+        vocabulary -- dictionary from features to column numbers (a vectorizer's vocabulary_)
+        
+        Optional keyword arguments:
+        columns    -- array of the column numbers of the features
+                      defaults to None (all the columns in order)
+        """
+        self.vocabulary = vocabulary
+        self.columns = columns
+        # The features in dictionary order, and the position in that order of each column.
+        # Shared with the FeatureNames made by indexing, and built on the first lookup.
+        self._lookup = _lookup if _lookup is not None else []
+    
+    def _name(self, column):
+        if not self._lookup:
+            features = list(self.vocabulary)
+            columns = np.fromiter(self.vocabulary.values(), dtype=np.int64, count=len(features))
+            positions = np.empty(len(features), dtype=np.int64)
+            positions[columns] = np.arange(len(features))
+            self._lookup.extend([features, positions])
+        features, positions = self._lookup
+        return features[positions[column]]
+    
+    def __len__(self):
+        if self.columns is None:
+            return len(self.vocabulary)
+        return len(self.columns)
+    
+    def __getitem__(self, key):
+        if isinstance(key, (int, np.integer)):
+            return self._name(key if self.columns is None else self.columns[key])
+        if isinstance(key, slice):
+            key = np.arange(len(self))[key]
+        key = np.asarray(key)
+        if key.dtype == bool:
+            key = np.flatnonzero(key)
+        columns = key if self.columns is None else self.columns[key]
+        return FeatureNames(self.vocabulary, columns, self._lookup)
+    
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+    
+    def __repr__(self):
+        return '<FeatureNames of {} features>'.format(len(self))
+
+
+def nbytes(value):
+    """
+    Return the approximate number of bytes used by an array, sparse matrix, \
+    dictionary of strings (like a vocabulary) or list of lists of strings (like tagger output).
+    """
+    if sparse.issparse(value):
+        return value.data.nbytes + value.indices.nbytes + value.indptr.nbytes
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(sys.getsizeof(key) for key in value)
+    if isinstance(value, list):
+        return sys.getsizeof(value) + sum(nbytes(item) for item in value)
+    return sys.getsizeof(value)
+
+
+def memory_report(model, tagged=None):
+    """
+    Return lines describing the memory used by each stage of a fitted pipeline.
+    
+    Required arguments:
+    model  -- fitted pipeline
+    
+    Optional keyword arguments:
+    tagged -- output of the pipeline's tagger for some texts (lists of features)
+              if given, the size of the output of each stage for these texts is reported too
+    """
+    lines = ['stage\tfitted MB\toutput MB\toutput type']
+    X = tagged
+    for name, step in model.steps:
+        estimator = getattr(step, 'estimator', step)
+        fitted = sum(nbytes(value) for attribute, value in vars(estimator).items()
+                     if attribute.endswith('_') and not attribute.startswith('_'))
+        if name != 'tag' and X is not None:
+            X = estimator.transform(X) if hasattr(estimator, 'transform') else None
+        if X is None:
+            output = ''
+            kind = ''
+        else:
+            output = '{:.2f}'.format(nbytes(X) / 2**20)
+            if sparse.issparse(X):
+                kind = 'sparse {} {}, {} indices'.format(X.shape, X.dtype, X.indices.dtype)
+            else:
+                kind = 'lists of features'
+        lines.append('{}\t{:.2f}\t{}\t{}'.format(name, fitted / 2**20, output, kind))
+    return lines
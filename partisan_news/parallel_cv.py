@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Cross-validate the partisan news pipeline with the folds in parallel processes.
+
+scikit-learn's cross_validate() refits the whole pipeline in every fold, \
+tagger included, one fold after another. Here instead the texts are tagged once, \
+and their features counted once, over all the terms of all the texts. \
+The counts (a sparse matrix) are put in shared memory, \
+and each worker process evaluates folds on that one copy of the matrix.
+
+Within each fold, the vocabulary is still chosen using only the fold's training texts \
+(the terms within the vectorizer's min_df and max_df), \
+and the rest of the pipeline (tf-idf, feature selection, classifier) is fitted \
+on the training texts only, so the scores are the same as with cross_validate().
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+import os
+import time
+
+import numpy as np
+from scipy import sparse
+from sklearn.base import clone
+from sklearn.metrics import accuracy_score, make_scorer
+from sklearn.model_selection import check_cv
+from sklearn.pipeline import Pipeline
+
+import profiling
+
+
+def count_matrix(features, dtype=np.int64):
+    """
+    Return the terms (in alphabetical order, as CountVectorizer sorts them) \
+    and a sparse matrix of their counts in each text.
+    
+    Required arguments:
+    features -- list of lists of features, as returned by a preprocessing.Tagger
+    
+    Optional keyword arguments:
+    dtype    -- type of the counts
+                defaults to numpy.int64 (as for CountVectorizer)
+    """
+    terms = sorted(set(feature for text_features in features for feature in text_features))
+    index = {term: i for i, term in enumerate(terms)}
+    columns = [index[feature] for text_features in features for feature in text_features]
+    indptr = np.cumsum([0] + [len(text_features) for text_features in features])
+    counts = sparse.csr_matrix((np.ones(len(columns), dtype=dtype), columns, indptr),
+                               shape=(len(features), len(terms)))
+    counts.sum_duplicates()
+    return terms, counts
+
+
+def share(array):
+    """
+    Copy an array into a new block of shared memory.
+    
+    Returns:
+    the SharedMemory (to close and unlink when done)
+    and a (name, shape, dtype) description to attach to it with attach()
+    """
+    memory = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+    np.ndarray(array.shape, dtype=array.dtype, buffer=memory.buf)[...] = array
+    return memory, (memory.name, array.shape, array.dtype.str)
+
+
+def attach(description):
+    """
+    Return the SharedMemory and the array described by a description from share().
+    """
+    name, shape, dtype = description
+    memory = shared_memory.SharedMemory(name=name)
+    return memory, np.ndarray(shape, dtype=dtype, buffer=memory.buf)
+
+
+# Data shared by the worker processes.
+# Set once per process by _init_worker(), rather than sent with each fold.
+_memories = None
+_counts = None
+_labels = None
+_settings = None
+
+
+def _set_data(counts, labels, settings):
+    global _counts, _labels, _settings
+    _counts = counts
+    _labels = labels
+    _settings = settings
+
+
+def _init_worker(descriptions, shape, labels, settings):
+    global _memories
+    _memories, (data, indices, indptr) = zip(*[attach(d) for d in descriptions])
+    _set_data(sparse.csr_matrix((data, indices, indptr), shape=shape, copy=False),
+              labels, settings)
+
+
+def vocabulary_columns(counts, min_df, max_df):
+    """
+    Return the columns of the terms that a CountVectorizer with min_df and max_df \
+    fitted on the texts of a count matrix would keep.
+    """
+    n_docs = counts.shape[0]
+    df = np.bincount(counts.indices, minlength=counts.shape[1])
+    min_count = min_df if isinstance(min_df, (int, np.integer)) else min_df * n_docs
+    max_count = max_df if isinstance(max_df, (int, np.integer)) else max_df * n_docs
+    return np.flatnonzero((df > 0) & (df >= min_count) & (df <= max_count))
+
+
+def evaluate_fold(fold, train, test):
+    """
+    Fit and score the model on one fold of the shared counts.
+    
+    Returns:
+    dictionary of fit_time, score_time and test scores, as in cross_validate(), \
+    and the profiling records of each stage in the fold (under 'profile')
+    """
+    profiler = profiling.Profiler(trace_memory=_settings['trace_memory'])
+    with profiler.phase('cross_validate', fold=fold):
+        start = time.perf_counter()
+        with profiler.measure('vectorize', 'fit_transform', n_docs=len(train)):
+            X_train, X_test = _counts[train], _counts[test]
+            columns = vocabulary_columns(X_train, _settings['min_df'], _settings['max_df'])
+            X_train, X_test = X_train[:, columns], X_test[:, columns]
+        y_train, y_test = _labels[train], _labels[test]
+        estimator = profiling.wrap(clone(_settings['estimator']), profiler).fit(X_train, y_train)
+        fit_time = time.perf_counter() - start
+        start = time.perf_counter()
+        scores = {'test_' + name: scorer(estimator, X_test, y_test)
+                  for name, scorer in _settings['scoring'].items()}
+        score_time = time.perf_counter() - start
+    return dict({'fit_time': fit_time, 'score_time': score_time}, **scores,
+                profile=profiler.records)
+
+
+def cross_validate(model, texts, labels, cv=5, scoring=None, n_jobs=None, profiler=None):
+    """
+    Cross-validate a pipeline of tag, vectorize, transform, select and classify steps.
+    
+    Required arguments:
+    model    -- pipeline (its tagger is used as it is, the other steps are refitted)
+    texts    -- sequence of raw texts
+    labels   -- sequence of their labels
+    
+    Optional keyword arguments:
+    cv       -- number of folds, or a scikit-learn cross-validation splitter
+                defaults to 5 (stratified folds, as for cross_validate())
+    scoring  -- dictionary of scorers
+                defaults to None (accuracy)
+    n_jobs   -- number of worker processes
+                defaults to None (one per fold, up to the number of CPUs)
+    profiler -- profiling.Profiler to record the time and memory of each stage in \
+                (the tagging and counting of all the texts as fold 'shared', \
+                then the stages of each fold, numbered from 1)
+                defaults to None (no profiling)
+    
+    Returns:
+    dictionary of arrays of fit_time, score_time and test_<scorer> for each fold, \
+    as returned by scikit-learn's cross_validate()
+    """
+    labels = np.asarray(labels)
+    steps = profiling.unwrap(model).steps
+    if profiler is None:
+        profiler = profiling.Profiler(trace_memory=False)
+    # Tag through the (possibly profiled) pipeline step, so tagging is recorded too.
+    with profiler.phase('cross_validate', fold='shared'):
+        features = model.named_steps['tag'].transform(texts)
+        with profiler.measure('vectorize', 'count_matrix', n_docs=len(features)):
+            _, counts = count_matrix(features, dict(steps)['vectorize'].dtype)
+    
+    splitter = check_cv(cv, labels, classifier=True)
+    folds = list(splitter.split(counts, labels))
+    if n_jobs is None:
+        n_jobs = min(len(folds), os.cpu_count() or 1)
+    vectorizer = dict(steps)['vectorize']
+    settings = {'min_df': vectorizer.min_df,
+                'max_df': vectorizer.max_df,
+                'estimator': Pipeline(steps[2:]),
+                'scoring': scoring or {'score': make_scorer(accuracy_score)},
+                'trace_memory': profiler.trace_memory}
+    
+    if n_jobs == 1:
+        _set_data(counts, labels, settings)
+        results = [evaluate_fold(fold, train, test)
+                   for fold, (train, test) in enumerate(folds, start=1)]
+    else:
+        memories, descriptions = zip(*[share(array)
+                                       for array in (counts.data, counts.indices, counts.indptr)])
+        try:
+            with ProcessPoolExecutor(n_jobs, initializer=_init_worker,
+                                     initargs=(descriptions, counts.shape, labels, settings)) as executor:
+                results = list(executor.map(evaluate_fold, range(1, len(folds) + 1),
+                                            *zip(*folds)))
+        finally:
+            for memory in memories:
+                memory.close()
+                memory.unlink()
+    for result in results:
+        profiler.add_records(result.pop('profile'))
+    return {key: np.array([result[key] for result in results]) for key in results[0]}
@@ -5,10 +5,10 @@ A pipeline for learning from the partisan news data.
 """
 
 # Standard library.
-from collections import deque
 from datetime import datetime
+import functools
 import math
-import re
+import time
 
 # External.
 import matplotlib.pyplot as plt
@@ -20,83 +20,31 @@ from sklearn.metrics import accuracy_score, precision_score, recall_score, roc_a
 from sklearn.model_selection import cross_validate, train_test_split
 from sklearn.naive_bayes import MultinomialNB
 from sklearn.pipeline import Pipeline
-import spacy
 
 # Local.
-import quotes
+import artifact
+import cache
+import checkpoint
+import corpus
+import evaluation
+import explain
+import incremental
+import memory
+import parallel_cv
+import preprocessing
+import profiling
+import streaming
 
 
 #%% Parameters
 
-parameters = {
-
-# Whether to remove quoted text.
-# Mainstream articles presumably sometimes quote partisan opinions.
-'remove_quotes': True,
-
-# Whether to replace the special 'curly' quote characters (‘’ and “”).
-# These may confuse the text parsing algorithms.
-'replace_curly_quotes': True,
-
-# Whether to strip surrounding punctuation from words.
-'strip_punctuation': True,
-
-# Which parts of speech to retain.
-# ADJectives
-# ADVerbs
-# INTerJections
-# NOUNs
-# VERBs
-'POS': ['ADJ', 'ADV', 'INTJ', 'NOUN', 'VERB'],
-
-# Whether to make all words lowercase.
-'lowercase': True,
-
-# Whether to discard words containing non-letter characters.
-# (Web addresses for example.)
-'letters_only': True,
-
-# Specific words to discard.
-# (For example words that happen to occur in a lot of partisan texts,
-# but clearly for arbitrary reasons like notices about ad blockers, etc.)
-'ignore': [
-'ad',
-'address',
-'article',
-'below',
-'blocker',
-'comment',
-'continue',
-'daily',
-'disable',
-'dose',
-'email',
-'image',
-'podcast',
-'read',
-'story',
-'video',
-'watch'
-],
-
-# Maximum length of ngrams.
-'max_ngram': 2,
-
-# Minimum document frequency for a term to be retained.
-# Terms that occur in fewer documents than this will be discarded.
-'min_occurrences': 10,
-
-# Maximum document frequency for a term to be retained.
-# Terms that occur in a greater proportion of documents than this will be discarded.
-'max_frequency': 0.9,
-
-# What proportion best features to retain.
-'p_best_features': 0.9,
-
-# How many folds to use in cross-validation.
-'k_folds': 5
-
-}
+# The parameters are defined in the settings module,
+# so that the other scripts in this folder use the same ones.
+# Edit them there.
+from settings import parameters, preprocess_keys, cache_settings, tagger_settings
+from settings import model_directory, profile_settings, validation_settings
+from settings import checkpoint_directory, checkpoint_stages, memory_settings
+from settings import evaluation_settings
 
 
 #%% Results file
@@ -134,15 +82,18 @@ log_print('[parameters]', *['{}: {}'.format(*x) for x in parameters.items()])
 # Also used as the category labels for the two types of text.
 filenames = ['mainstream', 'partisan']
 
-# Lists to hold the texts and their labels.
-items = []
-labels = []
+# Index the texts in the files.
+# The texts are only read from the files when they are needed.
+# The index of where each text starts and ends is saved next to each file,
+# so that unchanged files are not scanned again.
+documents = corpus.Corpus(filenames)
 
-# Read the file contents into the lists.
-for filename in filenames:
-    texts = re.findall('.+(?=\n+)', open(filename+'.txt', encoding='utf-8').read())
-    items = items + texts
-    labels = labels + [filename] * len(texts)
+# The texts and their labels.
+# items is a view of the texts that can be split like an array
+# (by train_test_split() and cross_validate())
+# without copying the texts.
+items = documents.view()
+labels = documents.labels
 
 # How many texts?
 log_print('[n texts]', len(items))
@@ -150,31 +101,9 @@ log_print('[n texts]', len(items))
 
 #%% Pipeline components: text preprocessing with spacy
 
-# Define a function to replace the curly quote characters.
-def replace_curlies(text):
-    text_new = text
-    for char in '‘’':
-        text_new = text_new.replace(char, "'")
-    for char in '“”':
-        text_new = text_new.replace(char, '"')
-    return text_new
-
-# Define a function to strip a word of leading and trailing punctuation.
-word_re = re.compile('[a-zA-Z].*[a-zA-Z]')
-def strip_punctuation(word):
-    match = word_re.search(word)
-    if match:
-        return match.group(0)
-    return ''
-
-# Load the spacy English language model.
-# Disable the dependency parser
-# and the named entity recognizer.
-# We only need the part of speech tagger.
-nlp = spacy.load('en', disable=['parser', 'ner'])
-
-# Define a function that preprocesses a text.
-# Use the functions defined above and the spacy language model.
+# The preprocessing functions are defined in the preprocessing module.
+# Each text is cleaned, tagged with the spacy language model,
+# and turned into a list of features:
 # Remove quoted text.
 # Replace some troublesome characters.
 # Discard punctuation.
@@ -183,38 +112,40 @@ nlp = spacy.load('en', disable=['parser', 'ner'])
 # Make lowercase.
 # Get unigrams.
 # Get ngrams where valid terms are adjacent.
-def preprocess(text):
-    if parameters['remove_quotes']:
-        text = quotes.remove(text)
-    if parameters['replace_curly_quotes']:
-        text = replace_curlies(text)
-    features = []
-    ngram = deque([], parameters['max_ngram'])
-    for token in nlp(text):
-        lemma = token.lemma_
-        if parameters['strip_punctuation']:
-            lemma = strip_punctuation(lemma)
-        valid_pos = token.pos_ in parameters['POS']
-        valid_chars = lemma.isalpha() or not parameters['letters_only']
-        valid_word = lemma not in parameters['ignore']
-        if valid_pos and valid_chars and valid_word:
-            if parameters['lowercase']:
-                lemma = lemma.lower()
-            features.append(lemma)
-            ngram.append(lemma)
-            if len(ngram) > 1:
-                features.append(' '.join(ngram))
-        else:
-            ngram.clear()
-    return features
+
+# Define a function that preprocesses a single text.
+# (A partial function rather than a def, so that it can be pickled with the model.)
+preprocess = functools.partial(preprocessing.preprocess, parameters=parameters)
+
+# Cache the preprocessed texts in memory and on disk.
+# Refitting in cross-validation and rerunning the script
+# then reuse the spacy output for texts that have been seen before.
+# The spacy version is part of the key, since it can change the output,
+# and so is the lexicon of the fast backend.
+preprocess_cache = cache.PreprocessCache(preprocess,
+                                         dict({key: parameters[key] for key in preprocess_keys},
+                                              spacy_version=preprocessing.spacy_version(),
+                                              **preprocessing.backend_key(parameters)),
+                                         **cache_settings)
+
+# Create a tagger component to preprocess all the texts in batches.
+# spacy can tag the batches in several processes at once.
+tagger = preprocessing.Tagger(parameters,
+                              batch_size=tagger_settings['batch_size'],
+                              n_process=tagger_settings['n_process'],
+                              cache=preprocess_cache)
 
 
 #%% Pipeline components: scikit-learn
 
-# Create a vectorizer component to turn the texts into counts of features.
-vectorizer = CountVectorizer(analyzer=preprocess,
+# Create a vectorizer component to turn the lists of features into counts.
+# The tagger has already extracted the features,
+# so the vectorizer's analyzer just passes them on.
+# In compact mode, count as float32 values (and so on through the pipeline).
+vectorizer = CountVectorizer(analyzer=preprocessing.identity,
                              min_df=parameters['min_occurrences'],
-                             max_df=parameters['max_frequency'])
+                             max_df=parameters['max_frequency'],
+                             dtype=memory.COMPACT_DTYPE if memory_settings['compact'] else np.int64)
 
 # Create a transform component.
 # tf-idf transform.
@@ -230,7 +161,8 @@ classifier = MultinomialNB(fit_prior=False)
 # Put the components in a pipeline.
 # Make the pipeline verbose so we can check its progress.
 # This is useful because the spacy preprocessing is very slow.
-model = Pipeline([('vectorize', vectorizer),
+model = Pipeline([('tag', tagger),
+                  ('vectorize', vectorizer),
                   ('transform', transformer),
                   ('select', feature_selecter),
                   ('classify', classifier)],
@@ -250,22 +182,99 @@ model = Pipeline([('vectorize', vectorizer),
 
 #%% Fit
 
-# Fit the model to the training data.
-model.fit(train_items, train_labels)
+# Identify the model by its parameters, the data it is trained on, compact mode
+# and the lexicon of the fast backend (if used).
+# If a model with the same key has been saved before, load it instead of fitting.
+model_key = artifact.make_key(parameters, [filename + '.txt' for filename in filenames],
+                              dict(compact=memory_settings['compact'],
+                                   **preprocessing.backend_key(parameters)))
+model_saved = artifact.exists(model_directory, model_key)
+if model_saved:
+    model = artifact.load(model_directory)
+    model.set_params(tag__batch_size=tagger_settings['batch_size'],
+                     tag__n_process=tagger_settings['n_process'],
+                     tag__cache=preprocess_cache)
+    log_print('[loaded saved model]', model_directory)
+
+# Checkpoints of the output of each stage of fitting, for the training texts.
+# Keyed by the data, the training texts and the parameters of each stage,
+# so that fitting resumes from the last stage whose parameters are unchanged.
+# The lexicon of the fast backend (if used) is part of the tagger's key too,
+# and the vectorizer's dtype (compact mode or not) of its key.
+data_key = {'data': artifact.make_key({}, [filename + '.txt' for filename in filenames]),
+            'train_indices': train_items.indices.tolist()}
+stage_settings = {'tag': preprocessing.backend_key(parameters),
+                  'vectorize': {'dtype': np.dtype(vectorizer.dtype).name}}
+checkpoints = checkpoint.Checkpoints(checkpoint_directory,
+                                     checkpoint.stage_keys(data_key, parameters, checkpoint_stages,
+                                                           stage_settings))
+
+# Record the time and memory used by each stage of the pipeline.
+profiler = profiling.Profiler(trace_memory=profile_settings['enabled'] and profile_settings['trace_memory'])
+if profile_settings['enabled']:
+    model = profiling.wrap(model, profiler)
+
+if not model_saved:
+    # Fit the model to the training data.
+    # Time it, to compare with the streaming mode in streaming.py.
+    fit_start = time.perf_counter()
+    with profiler.phase('fit'):
+        train_selected = checkpoint.fit(model, train_items, train_labels, checkpoints)
+    fit_seconds = time.perf_counter() - fit_start
+    log_print('[batch fit]', *streaming.resource_report(len(train_items), fit_seconds))
+    if memory_settings['compact']:
+        memory.compact(model)
+    # Save the fitted model, for scoring new texts elsewhere (see server.py).
+    artifact.save(model, model_directory, parameters, key=model_key)
+    # Save the sums needed to update it with new texts later (see incremental.py).
+    statistics = incremental.build(model, checkpoints.load_output('tag'), train_labels)
+    statistics.save(model_directory)
+elif checkpoints.valid('select'):
+    train_selected = checkpoints.load_output('select')
+else:
+    train_selected = None
+
+# Get the fitted components.
+tagger, vectorizer, transformer, feature_selecter, classifier = [step for name, step in model.steps]
+
+# How much memory does each stage use (fitted, and output for the training texts)?
+if memory_settings['report']:
+    log_print('[memory by stage]',
+              *memory.memory_report(model, checkpoints.load_output('tag')
+                                    if checkpoints.valid('tag') else None))
 
 # Get the order of category labels used.
 label_order = list(classifier.classes_)
 
 # Get the names of the features and selected features.
-features = np.array(vectorizer.get_feature_names())
+# (Looked up in the vocabulary only for the features that are shown.)
+features = memory.FeatureNames(vectorizer.vocabulary_)
 features_used = features[feature_selecter.get_support()]
 
-# Get the feature coefficients.
-coefs = np.squeeze(classifier.coef_)
+# Get the feature coefficients:
+# the difference in log probability of each feature between the classes
+# (as in explain.Explainer; MultinomialNB has no coef_ in recent scikit-learn).
+coefs = (classifier.feature_log_prob_[label_order.index('partisan')]
+         - classifier.feature_log_prob_[label_order.index('mainstream')])
 
 # Get the predicted labels and probabilities of partisanship.
-predicted_labels = model.predict(train_items)
-predicted_probs = model.predict_proba(train_items)[:, label_order.index('partisan')]
+# From the selected features of the training texts if they are saved,
+# rather than preprocessing the texts again.
+with profiler.phase('predict'):
+    if train_selected is None:
+        predicted_labels = model.predict(train_items)
+    else:
+        predicted_labels = classifier.predict(train_selected)
+with profiler.phase('predict_proba'):
+    if train_selected is None:
+        predicted_probs = model.predict_proba(train_items)
+    else:
+        predicted_probs = classifier.predict_proba(train_selected)
+    predicted_probs = predicted_probs[:, label_order.index('partisan')]
+
+# How often was the preprocessing cache used?
+log_print('[preprocessing cache after fit]',
+          *['{}: {}'.format(*x) for x in preprocess_cache.stats().items()])
 
 
 #%% Check
@@ -284,8 +293,9 @@ log_print('[most frequent terms]', *features_by_idf[:n_show])
 log_print('[least frequent terms]', *features_by_idf[-n_show:])
 
 # What are the most informative features?
-features_by_coef = features_used[np.argsort(coefs)]
-n_tied = sum(coefs == min(coefs))
+# (Largest difference in favour of partisan first.)
+features_by_coef = features_used[np.argsort(-coefs, kind='stable')]
+n_tied = sum(coefs == max(coefs))
 if n_tied > n_show:
     extra_msg = ' ({} tied)'.format(n_tied)
     n_show_temp = n_tied
@@ -311,10 +321,18 @@ plt.plot(threshold, recall, label='recall')
 plt.vlines(0.5, 0, 1, linestyles='dashed')
 plt.xlabel('threshold')
 plt.legend()
+plt.savefig(timestamp + '_precision_recall.png')
 plt.show()
 
+# Precision, recall, F1 and ROC AUC, with bootstrap confidence intervals.
+# Also written as tables, at every threshold and at thresholds from 0 to 1.
+evaluation_lines = evaluation.report(train_labels == filenames[-1], predicted_probs,
+                                     timestamp + '_train', **evaluation_settings)
+log_print('[evaluation on training data with {} bootstrap resamples]'.format(
+          evaluation_settings['n_resamples']), *evaluation_lines)
+
 # Which texts did the model rate as most and least partisan?
-items_by_prob = np.array(train_items)[np.argsort(predicted_probs)]
+items_by_prob = train_items[np.argsort(predicted_probs)]
 probs_sorted = predicted_probs[np.argsort(predicted_probs)]
 for i in [0, -1]:
     log_print('[{} partisan text]'.format(['least', 'most'][i]),
@@ -337,10 +355,16 @@ They make me sick to the stomach with their degeneracy. \
 We should round them all up and shoot them.'}
 
 # Does the model appropriately classify the exemplar texts?
-for category, exemplar in exemplars.items():
+# Which features contribute most to their partisanship?
+explainer = explain.Explainer(model)
+_, top_names, top_contributions = explainer.explain(list(exemplars.values()), k=5)
+for category, exemplar, names, contributions in zip(exemplars, exemplars.values(),
+                                                    top_names, top_contributions):
     log_print('[test on exemplary {} text]'.format(category),
               exemplar,
-              '* P(partisan) = {:.2f}'.format(prob_partisan(exemplar)))
+              '* P(partisan) = {:.2f}'.format(prob_partisan(exemplar)),
+              *['  {}\t{:+.3f}'.format(name, value)
+                for name, value in zip(names, contributions) if name])
 
 
 #%% Validate
@@ -349,16 +373,38 @@ for category, exemplar in exemplars.items():
 scorers = {'accuracy': make_scorer(accuracy_score),
            'precision': make_scorer(precision_score, pos_label=filenames[-1]),
            'recall': make_scorer(recall_score, pos_label=filenames[-1]),
-           'ROC_AUC': make_scorer(roc_auc_score, needs_threshold=True)}
+           'ROC_AUC': make_scorer(roc_auc_score,
+                                  response_method=('decision_function', 'predict_proba'))}
 
 # Check the performance metrics in k-fold cross-validation.
+# In parallel, the texts are tagged once and the folds share their features
+# (profiled as fold 'shared', before the stages of each fold).
 print('\n\n')
-cv_result = cross_validate(model, train_items, train_labels,
-                           cv=parameters['k_folds'],
-                           scoring=scorers,
-                           verbose=3)
+with profiler.phase('cross_validate'):
+    if validation_settings['parallel']:
+        cv_result = parallel_cv.cross_validate(model, train_items, train_labels,
+                                               cv=parameters['k_folds'],
+                                               scoring=scorers,
+                                               n_jobs=validation_settings['n_jobs'],
+                                               profiler=profiler if profile_settings['enabled']
+                                               else None)
+    else:
+        cv_result = cross_validate(model, train_items, train_labels,
+                                   cv=parameters['k_folds'],
+                                   scoring=scorers,
+                                   verbose=3)
 log_print('[{}-fold cross-validation]'.format(parameters['k_folds']),
           *['{}\t{:.2f}\t{}'.format(key, np.mean(value), value) for key, value in cv_result.items()])
+log_print('[preprocessing cache after cross-validation]',
+          *['{}: {}'.format(*x) for x in preprocess_cache.stats().items()])
+
+
+#%% Profile
+
+# Time and memory used by each stage, in each phase and cross-validation fold.
+# One JSON object per line, for comparing with other runs.
+if profile_settings['enabled']:
+    log_print('[profile (JSON lines)]', *profiler.json_lines())
 
 
 #%% Final test
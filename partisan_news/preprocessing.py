@@ -0,0 +1,414 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Text preprocessing for the partisan news pipeline.
+
+Texts are cleaned (quotes removed, curly quote characters replaced), \
+tagged with spacy, and turned into lists of features (lemmas and ngrams).
+With parameters['backend'] set to 'fast', texts are tagged \
+with the much faster (but less accurate) lookup table of fast_tagging.py instead.
+
+The Tagger class does this for a whole corpus at once, \
+as the first component of a scikit-learn Pipeline.
+Use it together with a CountVectorizer(analyzer=identity), \
+which then only has to count the features.
+"""
+
+from collections import deque
+import functools
+from importlib import metadata
+import re
+import string
+import time
+
+from sklearn.base import BaseEstimator, TransformerMixin
+
+import fast_tagging
+import quotes
+
+
+# Name of the spacy language model.
+NLP_NAME = 'en'
+
+# The spacy language model.
+# Loaded by get_nlp() the first time it is needed.
+nlp = None
+
+
+def get_nlp():
+    """
+    Return the spacy language model, loading it if necessary.
+    
+    Disables the dependency parser and the named entity recognizer.
+    We only need the part of speech tagger.
+    
+    spacy itself is imported here too, since importing it takes a while \
+    and a loaded model can score texts without it if they are all cached.
+    """
+    global nlp
+    if nlp is None:
+        import spacy
+        nlp = spacy.load(NLP_NAME, disable=['parser', 'ner'])
+    return nlp
+
+
+def spacy_version():
+    """
+    Return the installed spacy version, without importing spacy.
+    """
+    return metadata.version('spacy')
+
+
+def backend_key(parameters):
+    """
+    Return a dictionary of what the tagger chosen by parameters['backend'] depends on \
+    besides the parameters, for the keys of cached results: \
+    for the fast backend, a hash of its lexicon (so that a rebuilt lexicon is not ignored). \
+    Empty for spacy (whose version is keyed separately, with spacy_version()).
+    """
+    if parameters.get('backend', 'spacy') == 'fast':
+        return {'lexicon': fast_tagging.lexicon_hash()}
+    return {}
+
+
+def replace_curlies(text):
+    """
+    Replace the curly quote characters (‘’ and “”) with straight ones.
+    """
+    text_new = text
+    for char in '‘’':
+        text_new = text_new.replace(char, "'")
+    for char in '“”':
+        text_new = text_new.replace(char, '"')
+    return text_new
+
+
+word_re = re.compile('[a-zA-Z].*[a-zA-Z]')
+def strip_punctuation(word):
+    """
+    Strip a word of leading and trailing punctuation.
+    """
+    match = word_re.search(word)
+    if match:
+        return match.group(0)
+    return ''
+
+
+# What replace_curlies() replaces each curly quote character with.
+CURLY_QUOTES = {'‘': "'", '’': "'", '“': '"', '”': '"'}
+
+# Punctuation characters for a Normalizer to strip (apostrophes are kept).
+PUNCTUATION_RE = re.compile('[' + re.escape(string.punctuation.replace("'", '')) + ']')
+
+
+class Normalizer:
+    """
+    Clean a text for tagging in a single pass.
+    
+    Gives the same result as quotes.remove(text, ellipsis) followed by replace_curlies(), \
+    but copies the text only once, instead of once for each of those five steps.
+    
+    The positions of the quote characters (and line breaks, which quotes cannot span) \
+    are found with str.find(), which is much faster than a regular expression \
+    with lookbehinds at every position. Only those positions are then examined, \
+    to find the quoted text to remove and the characters to replace, \
+    and the text between them is copied to the result unchanged.
+    """
+    
+    def __init__(self, remove_quotes=True, replace_curly_quotes=True, strip_punctuation=False,
+                 ellipsis=' '):
+        """
+        Optional keyword arguments:
+        remove_quotes        -- whether to replace quoted text with the ellipsis
+                                defaults to True
+        replace_curly_quotes -- whether to replace curly quote characters with straight ones
+                                defaults to True
+        strip_punctuation    -- whether to also replace punctuation characters with spaces
+                                (except apostrophes, and not in the ellipsis)
+                                defaults to False
+        ellipsis             -- string to insert in place of quoted text
+                                defaults to space (' ')
+        """
+        self.remove_quotes = remove_quotes
+        self.replace_curly_quotes = replace_curly_quotes
+        self.strip_punctuation = strip_punctuation
+        self.ellipsis = ellipsis
+        self.replacements = dict(CURLY_QUOTES) if replace_curly_quotes else {}
+        if strip_punctuation:
+            self.replacements = {char: PUNCTUATION_RE.sub(' ', new)
+                                 for char, new in self.replacements.items()}
+        # The characters to stop at.
+        self.chars = ''.join(set(quotes.OPENQUOTE_CHARS + quotes.CLOSEQUOTE_CHARS + ['\n'])
+                             if remove_quotes else [])
+        self.chars += ''.join(char for char in self.replacements if char not in self.chars)
+    
+    def positions(self, text):
+        """
+        Return a sorted list of the positions of the characters to stop at in a text.
+        """
+        positions = []
+        for char in self.chars:
+            i = text.find(char)
+            while i != -1:
+                positions.append(i)
+                i = text.find(char, i + 1)
+        positions.sort()
+        return positions
+    
+    def __call__(self, text):
+        positions = self.positions(text)
+        n = len(positions)
+        if self.remove_quotes:
+            # For each position, the index of the next position
+            # with a closing quote (after non-whitespace) and with a line break.
+            next_close = [n] * (n + 1)
+            next_break = [n] * (n + 1)
+            for k in range(n - 1, -1, -1):
+                i = positions[k]
+                char = text[i]
+                closes = char in quotes.CLOSEQUOTE_CHARS and i > 0 and not text[i-1].isspace()
+                next_close[k] = k if closes else next_close[k+1]
+                next_break[k] = k if char == '\n' else next_break[k+1]
+        if self.strip_punctuation:
+            copy = functools.partial(PUNCTUATION_RE.sub, ' ')
+        else:
+            copy = str
+        pieces = []
+        start = 0
+        k = 0
+        while k < n:
+            i = positions[k]
+            char = text[i]
+            if (self.remove_quotes and char in quotes.OPENQUOTE_CHARS
+                    and (i == 0 or text[i-1].isspace())):
+                # Quoted text ends at the first closing quote, on the same line.
+                close = next_close[k+1]
+                if close < next_break[k+1]:
+                    pieces.append(copy(text[start:i]))
+                    pieces.append(self.ellipsis)
+                    start = positions[close] + 1
+                    k = close + 1
+                    continue
+            if char in self.replacements:
+                pieces.append(copy(text[start:i]))
+                pieces.append(self.replacements[char])
+                start = i + 1
+            k += 1
+        pieces.append(copy(text[start:]))
+        return ''.join(pieces)
+
+
+@functools.lru_cache()
+def normalizer(remove_quotes=True, replace_curly_quotes=True, strip_punctuation=False,
+               ellipsis=' '):
+    """
+    Return a Normalizer with these settings (the same one each time).
+    """
+    return Normalizer(remove_quotes, replace_curly_quotes, strip_punctuation, ellipsis)
+
+
+def clean(text, parameters):
+    """
+    Prepare a text for tagging.
+    
+    Remove quoted text and replace some troublesome characters, \
+    depending on parameters['remove_quotes'] and parameters['replace_curly_quotes'].
+    """
+    return normalizer(parameters['remove_quotes'], parameters['replace_curly_quotes'])(text)
+
+
+def annotate_doc(tokens):
+    """
+    Return a list of (lemma, part of speech) pairs for a sequence of spacy tokens.
+    These are all that features_from_annotations() needs from spacy.
+    """
+    return [(token.lemma_, token.pos_) for token in tokens]
+
+
+def features_from_annotations(annotations, parameters):
+    """
+    Return the list of features for a sequence of (lemma, part of speech) pairs.
+    
+    Discard punctuation.
+    Extract only the requested parts of speech.
+    Use lemmas (standard forms).
+    Make lowercase.
+    Get unigrams.
+    Get ngrams where valid terms are adjacent.
+    """
+    features = []
+    ngram = deque([], parameters['max_ngram'])
+    for lemma, pos in annotations:
+        if parameters['strip_punctuation']:
+            lemma = strip_punctuation(lemma)
+        valid_pos = pos in parameters['POS']
+        valid_chars = lemma.isalpha() or not parameters['letters_only']
+        valid_word = lemma not in parameters['ignore']
+        if valid_pos and valid_chars and valid_word:
+            if parameters['lowercase']:
+                lemma = lemma.lower()
+            features.append(lemma)
+            ngram.append(lemma)
+            if len(ngram) > 1:
+                features.append(' '.join(ngram))
+        else:
+            ngram.clear()
+    return features
+
+
+def annotate_cleaned(texts, parameters, batch_size=50, n_process=1):
+    """
+    Generate a list of (lemma, part of speech) pairs for each cleaned text, \
+    with the tagger chosen by parameters['backend'] ('spacy' if missing).
+    
+    batch_size and n_process are passed to spacy's nlp.pipe().
+    The fast backend tags one text at a time in this process.
+    """
+    backend = parameters.get('backend', 'spacy')
+    if backend == 'fast':
+        lexicon = fast_tagging.get_lexicon()
+        for text in texts:
+            yield fast_tagging.annotate(text, lexicon)
+    elif backend == 'spacy':
+        for doc in get_nlp().pipe(texts, batch_size=batch_size, n_process=n_process):
+            yield annotate_doc(doc)
+    else:
+        raise ValueError('unknown backend: {!r}'.format(backend))
+
+
+def annotate(texts, parameters, batch_size=50, n_process=1):
+    """
+    Return a list of (lemma, part of speech) pairs for each text.
+    
+    Only parameters['remove_quotes'], parameters['replace_curly_quotes'] \
+    and parameters['backend'] affect the result, so the annotations can be reused \
+    with different values of the other preprocessing parameters.
+    """
+    cleaned = (clean(text, parameters) for text in texts)
+    return list(annotate_cleaned(cleaned, parameters, batch_size, n_process))
+
+
+def preprocess(text, parameters):
+    """
+    Return the list of features for a single text.
+    """
+    annotations, = annotate_cleaned([clean(text, parameters)], parameters)
+    return features_from_annotations(annotations, parameters)
+
+
+def identity(features):
+    """
+    Return the features unchanged.
+    For use as the analyzer of a CountVectorizer after a Tagger.
+    """
+    return features
+
+
+class Tagger(BaseEstimator, TransformerMixin):
+    """
+    Pipeline component that turns raw texts into lists of features.
+    
+    Tags a whole batch of texts with spacy's nlp.pipe(), \
+    optionally spread across several processes \
+    (or with fast_tagging.py if parameters['backend'] is 'fast').
+    """
+    
+    def __init__(self, parameters, batch_size=50, n_process=1, cache=None, profiler=None):
+        """
+        Required arguments:
+        parameters -- dictionary of preprocessing parameters
+                      (as in the parameters of partisan_news.py)
+        
+        Optional keyword arguments:
+        batch_size -- number of texts per batch sent to spacy
+                      defaults to 50
+        n_process  -- number of processes for spacy to use
+                      defaults to 1
+                      (fewer for fewer texts: at most one process per batch_size texts)
+        cache      -- cache.PreprocessCache for the features of each text
+                      defaults to None (no caching)
+                      only texts missing from the cache are tagged
+        profiler   -- profiling.Profiler to record the time of each sub-stage in
+                      defaults to None (no profiling)
+        """
+        self.parameters = parameters
+        self.batch_size = batch_size
+        self.n_process = n_process
+        self.cache = cache
+        self.profiler = profiler
+    
+    def fit(self, texts, labels=None):
+        """
+        Nothing to learn.
+        """
+        return self
+    
+    def _processes_for(self, n_texts):
+        # Starting a process costs far more than tagging a few texts,
+        # so each process gets at least a whole batch
+        # (and a single text, as when scoring one text, is tagged in this process).
+        return max(1, min(self.n_process, n_texts // self.batch_size))
+    
+    def transform(self, texts):
+        """
+        Return a list with the list of features for each text.
+        """
+        results = [None] * len(texts)
+        missing = []
+        for i, text in enumerate(texts):
+            if self.cache is not None:
+                results[i] = self.cache.get(text)
+            if results[i] is None:
+                missing.append(i)
+        if not missing:
+            return results
+        if self.profiler is None:
+            cleaned = (clean(texts[i], self.parameters) for i in missing)
+            annotations = annotate_cleaned(cleaned, self.parameters,
+                                           batch_size=self.batch_size,
+                                           n_process=self._processes_for(len(missing)))
+            features = (features_from_annotations(annotation, self.parameters)
+                        for annotation in annotations)
+        else:
+            features = self._profiled_features([texts[i] for i in missing])
+        for i, text_features in zip(missing, features):
+            results[i] = text_features
+            if self.cache is not None:
+                self.cache.put(texts[i], results[i])
+        return results
+    
+    def _profiled_features(self, texts):
+        # The same as the steps in transform(), but one sub-stage at a time,
+        # timing each sub-stage and each text.
+        profiler = self.profiler
+        n_docs = len(texts)
+        doc_times = [0.0] * n_docs
+        
+        def timed_map(func, items):
+            results = []
+            for i, item in enumerate(items):
+                start = time.perf_counter()
+                results.append(func(item))
+                doc_times[i] += time.perf_counter() - start
+            return results
+        
+        with profiler.measure('tag/normalize', 'transform', n_docs):
+            texts = timed_map(lambda text: clean(text, self.parameters), texts)
+        # With batches, the time per text is the time between texts coming out of spacy.
+        backend = self.parameters.get('backend', 'spacy')
+        with profiler.measure('tag/' + backend, 'transform', n_docs):
+            annotations = []
+            start = time.perf_counter()
+            for i, annotation in enumerate(annotate_cleaned(texts, self.parameters,
+                                                            batch_size=self.batch_size,
+                                                            n_process=self._processes_for(n_docs))):
+                annotations.append(annotation)
+                end = time.perf_counter()
+                doc_times[i] += end - start
+                start = end
+        with profiler.measure('tag/ngrams', 'transform', n_docs):
+            features = timed_map(lambda annotation: features_from_annotations(annotation,
+                                                                              self.parameters),
+                                 annotations)
+        profiler.add_doc_times(doc_times)
+        return features
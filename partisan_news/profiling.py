@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Measure the time and memory used by each stage of the partisan news pipeline.
+
+A Profiler collects one record per stage and call, with:
+wall time, CPU time (of this process), and peak memory allocated by Python and numpy \
+(measured with tracemalloc, which slows things down somewhat; it can be switched off).
+
+Wrap the steps of a pipeline with wrap() to profile every fit, transform and predict. \
+Give a preprocessing.Tagger the profiler too, \
+to split the tag stage into normalization (quote removal and curly quote replacement), \
+tagging and ngram building, and to record the time taken per text.
+
+Records can be written out as JSON lines, for comparing runs.
+"""
+
+from contextlib import contextmanager
+import json
+import time
+import tracemalloc
+
+import numpy as np
+from sklearn.base import BaseEstimator
+from sklearn.pipeline import Pipeline
+from sklearn.utils.validation import check_is_fitted
+
+
+class Profiler:
+    """
+    Collect time and memory measurements.
+    
+    Set the phase (for example 'fit' or 'cross_validate') with Profiler.phase(), \
+    and measure stages with Profiler.measure().
+    In the 'cross_validate' phase, each fit of the first stage starts a new fold, \
+    unless the phase is given a fold.
+    """
+    
+    def __init__(self, trace_memory=True):
+        """
+        Optional keyword arguments:
+        trace_memory -- whether to measure peak memory with tracemalloc
+                        defaults to True
+        """
+        self.trace_memory = trace_memory
+        self.records = []
+        self.doc_times = {}
+        self.current_phase = None
+        self.fold = None
+        self.count_folds = False
+        self.first_stage = None
+        # Peak memory of the measurements in progress, outermost first.
+        self._stack = []
+    
+    def __deepcopy__(self, memo):
+        """
+        Copies of a profiler share the same records.
+        (Scikit-learn deep-copies the parameters of a pipeline in cross-validation.)
+        """
+        return self
+    
+    @contextmanager
+    def phase(self, name, fold=None):
+        """
+        Context manager labelling the measurements made inside it.
+        Phases can be nested: the outer phase's labels are restored afterwards.
+        
+        Required arguments:
+        name -- name of the phase
+        
+        Optional keyword arguments:
+        fold -- label of the fold (or other part of the phase) measured inside it
+                defaults to None (no fold, but in the 'cross_validate' phase \
+                each fit of the first stage starts a new fold, numbered from 1)
+        """
+        previous = self.current_phase, self.fold, self.count_folds
+        self.current_phase = name
+        self.count_folds = fold is None and name == 'cross_validate'
+        self.fold = 0 if self.count_folds else fold
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        try:
+            yield self
+        finally:
+            self.current_phase, self.fold, self.count_folds = previous
+    
+    @contextmanager
+    def measure(self, stage, method='', n_docs=None):
+        """
+        Context manager recording the time and memory used inside it.
+        
+        Required arguments:
+        stage  -- name of the stage
+        
+        Optional keyword arguments:
+        method -- name of the method called (for example 'transform')
+        n_docs -- number of texts processed
+        """
+        if self.count_folds and stage == self.first_stage and method.startswith('fit'):
+            self.fold += 1
+        tracing = self.trace_memory and tracemalloc.is_tracing()
+        if tracing:
+            current, peak = tracemalloc.get_traced_memory()
+            if self._stack:
+                self._stack[-1][1] = max(self._stack[-1][1], peak)
+            tracemalloc.reset_peak()
+            self._stack.append([current, current])
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        try:
+            yield
+        finally:
+            record = {'phase': self.current_phase,
+                      'fold': self.fold,
+                      'stage': stage,
+                      'method': method,
+                      'n_docs': n_docs,
+                      'wall_s': time.perf_counter() - wall_start,
+                      'cpu_s': time.process_time() - cpu_start}
+            if tracing:
+                start, peak = self._stack.pop()
+                peak = max(peak, tracemalloc.get_traced_memory()[1])
+                record['peak_mb'] = (peak - start) / 2**20
+                if self._stack:
+                    self._stack[-1][1] = max(self._stack[-1][1], peak)
+            self.records.append(record)
+    
+    def add_records(self, records):
+        """
+        Add records made by another profiler (for example in a worker process).
+        """
+        self.records.extend(records)
+    
+    def add_doc_times(self, seconds):
+        """
+        Add the preprocessing times of individual texts (in seconds) to the current phase.
+        """
+        key = (self.current_phase, self.fold)
+        self.doc_times.setdefault(key, []).extend(seconds)
+    
+    def doc_time_summary(self):
+        """
+        Return a list of records of per-text preprocessing time percentiles (in ms),
+        one for each phase (and fold).
+        """
+        summary = []
+        for (phase, fold), seconds in self.doc_times.items():
+            ms = np.array(seconds) * 1000
+            record = {'phase': phase, 'fold': fold, 'stage': 'tag/per_doc',
+                      'n_docs': len(ms)}
+            for p in [50, 90, 95, 99]:
+                record['p{}_ms'.format(p)] = float(np.percentile(ms, p))
+            record['max_ms'] = float(ms.max())
+            summary.append(record)
+        return summary
+    
+    def json_lines(self):
+        """
+        Return all the records, one JSON string per record.
+        """
+        return [json.dumps(record) for record in self.records + self.doc_time_summary()]
+
+
+class Profiled(BaseEstimator):
+    """
+    Pipeline step that records the time and memory of each call to another step.
+    Other attributes (for example vocabulary_ or classes_) are looked up on the wrapped step.
+    """
+    
+    def __init__(self, estimator, stage, profiler):
+        """
+        Required arguments:
+        estimator -- the pipeline step to wrap
+        stage     -- name of the step
+        profiler  -- Profiler to record in
+        """
+        self.estimator = estimator
+        self.stage = stage
+        self.profiler = profiler
+    
+    def __getattr__(self, name):
+        # Only called for attributes that are not found on the wrapper itself.
+        if name in ('estimator', 'stage', 'profiler') or name.startswith('__'):
+            raise AttributeError(name)
+        return getattr(self.estimator, name)
+    
+    def __sklearn_tags__(self):
+        # Look like the wrapped step, so a pipeline ending in a classifier
+        # is still treated as a classifier (stratified folds, probability scores).
+        return self.estimator.__sklearn_tags__()
+    
+    def __sklearn_is_fitted__(self):
+        try:
+            check_is_fitted(self.estimator)
+            return True
+        except Exception:
+            return False
+    
+    def _call(self, method, X, *args, **kwargs):
+        with self.profiler.measure(self.stage, method, n_docs=_n_docs(X)):
+            return getattr(self.estimator, method)(X, *args, **kwargs)
+    
+    def fit(self, X, y=None, **kwargs):
+        self._call('fit', X, y, **kwargs)
+        return self
+    
+    def fit_transform(self, X, y=None, **kwargs):
+        return self._call('fit_transform', X, y, **kwargs)
+    
+    def transform(self, X):
+        return self._call('transform', X)
+    
+    def predict(self, X):
+        return self._call('predict', X)
+    
+    def predict_proba(self, X):
+        return self._call('predict_proba', X)
+
+
+def _n_docs(X):
+    if hasattr(X, 'shape'):
+        return X.shape[0]
+    return len(X)
+
+
+def wrap(model, profiler):
+    """
+    Return a copy of a pipeline with each step wrapped in Profiled.
+    A Tagger step is also given the profiler, to measure its sub-stages.
+    """
+    if 'tag' in model.named_steps:
+        model.set_params(tag__profiler=profiler)
+    profiler.first_stage = model.steps[0][0]
+    return Pipeline([(name, Profiled(step, name, profiler)) for name, step in model.steps],
+                    verbose=model.verbose)
+
+
+def unwrap(model):
+    """
+    Return a copy of a pipeline with the Profiled wrappers removed.
+    """
+    return Pipeline([(name, getattr(step, 'estimator', step)) for name, step in model.steps],
+                    verbose=model.verbose)
@@ -2,9 +2,20 @@
 # -*- coding: utf-8 -*-
 """
 Work with quoted text in strings.
+
+The quotes in a string are located by scanning its quote characters once, \
+giving the (start, end) offsets of each quote. \
+find() and remove() are built on these spans, \
+slicing the string only for the quotes returned or the text kept.
 """
 
+import bisect
+from concurrent.futures import ProcessPoolExecutor
+import functools
+import os
 import re
+import shutil
+import tempfile
 
 
 # Quote characters.
@@ -24,6 +35,140 @@ CLOSEQUOTE_RE = r'(?<=\S)(' + '|'.join(CLOSEQUOTE_CHARS) + ')'
 # Any string of characters other than the quote characters.
 FILLER_RE = '[^' + ''.join(list(set(OPENQUOTE_CHARS + CLOSEQUOTE_CHARS))) + ']*'
 
+# Regex for any quote character.
+QUOTECHAR_RE = re.compile('[' + ''.join(list(set(OPENQUOTE_CHARS + CLOSEQUOTE_CHARS))) + ']')
+
+# Regex for the characters that change the state of remove_stream():
+# quote characters and line breaks.
+EVENT_RE = re.compile('[' + ''.join(list(set(OPENQUOTE_CHARS + CLOSEQUOTE_CHARS))) + '\n]')
+
+# Regex for a word that find_many() can look up in a single pass.
+# (Other words are searched for one at a time, as by find().)
+WORD_RE = re.compile(r'\w+')
+
+# Maximum number of compiled patterns to keep for find().
+PATTERN_CACHE_SIZE = 256
+
+# Number of characters in a batch of texts below which remove_many() and find_many_docs()
+# work in this process, because starting a pool of processes
+# and sending it the texts would take longer than the work itself.
+# (See benchmark_batch.py.)
+MIN_PARALLEL_CHARS = 2**22
+
+
+@functools.lru_cache(maxsize=PATTERN_CACHE_SIZE)
+def compile_pattern(word, case=False):
+    """
+    Return the compiled regex for a word that find() searches for.
+    The most recently used patterns are kept, so repeated searches do not compile them again.
+    """
+    
+    if case:
+        flags = 0
+    else:
+        flags = re.IGNORECASE
+    
+    # The target word:
+    # The word preceded and followed by a non-word character.
+    # (This excludes other words that contain the target word.)
+    return re.compile(r'(?<=\W){}(?=\W)'.format(word), flags)
+
+
+def is_opening(text, i):
+    """
+    Whether the character at position i of a string can open a quote.
+    """
+    return text[i] in OPENQUOTE_CHARS and (i == 0 or text[i - 1].isspace())
+
+
+def is_closing(text, i):
+    """
+    Whether the character at position i of a string can close a quote.
+    """
+    return text[i] in CLOSEQUOTE_CHARS and not text[i - 1].isspace()
+
+
+def quote_positions(text):
+    """
+    Return the positions of the quote characters in a string.
+    """
+    return [match.start() for match in QUOTECHAR_RE.finditer(text)]
+
+
+def spans(text):
+    """
+    Return the (start, end) offsets of the quotes in a string, as removed by remove().
+    
+    A quote runs from an opening quote character \
+    to the first closing quote character after it on the same line, \
+    so it may contain other quote characters. \
+    Each quote character is looked at once or twice, so the time taken is linear.
+    """
+    positions = quote_positions(text)
+    n = len(positions)
+    found = []
+    line_end = -1
+    k = 0
+    while k < n:
+        start = positions[k]
+        if not is_opening(text, start):
+            k += 1
+            continue
+        if line_end < start:
+            line_end = text.find('\n', start)
+            if line_end == -1:
+                line_end = len(text)
+        k += 1
+        while k < n and positions[k] < line_end and not is_closing(text, positions[k]):
+            k += 1
+        if k < n and positions[k] < line_end:
+            found.append((start, positions[k] + 1))
+            k += 1
+        else:
+            # No quote can close on this line, so none can open on it either.
+            k = bisect.bisect(positions, line_end)
+    return found
+
+
+def inner_spans(text, positions=None, gaps=None):
+    """
+    Return the (start, end) offsets of the quotes in a string, as found by find().
+    
+    A quote runs from an opening quote character to the very next quote character, \
+    which must close it, so it contains no other quote characters. \
+    A quote character that closes one quote cannot open the next.
+    
+    Required arguments:
+    text      -- string in which to search
+    
+    Optional keyword arguments:
+    positions -- positions of the quote characters in the string, from quote_positions()
+                 defaults to None (find them)
+    gaps      -- sorted numbers of the gaps between consecutive quote characters to consider \
+                 (gap i is between the ith and i+1th quote characters)
+                 defaults to None (all of them)
+    """
+    if positions is None:
+        positions = quote_positions(text)
+    if gaps is None:
+        gaps = range(len(positions) - 1)
+    found = []
+    previous = None
+    for i in gaps:
+        if (0 <= i < len(positions) - 1 and previous != i - 1
+                and is_opening(text, positions[i]) and is_closing(text, positions[i + 1])):
+            found.append((positions[i], positions[i + 1] + 1))
+            previous = i
+    return found
+
+
+def _gaps(positions, starts):
+    """
+    Return the sorted numbers of the gaps between quote characters \
+    that contain some positions (from the same string).
+    """
+    return sorted(set(bisect.bisect(positions, start) - 1 for start in starts))
+
 
 def find(text, word='', case=False):
     """
@@ -51,24 +196,72 @@ def find(text, word='', case=False):
     Quoted text always ends with a non-whitespace.
     """
     
-    if case:
-        flags = 0
-    else:
-        flags = re.IGNORECASE
+    positions = quote_positions(text)
     
-    # The target word:
-    # The word preceded and followed by a non-word character.
-    # (This excludes other words that contain the target word.)
+    # The possible quotes that contain the word.
+    # (Only the text within them is searched.)
     if word:
-        target = r'(?<=\W){}(?=\W)'.format(word)
+        pattern = compile_pattern(word, case)
+        gaps = [i for i in range(len(positions) - 1)
+                if is_opening(text, positions[i]) and is_closing(text, positions[i + 1])
+                and pattern.search(text, positions[i] + 1, positions[i + 1] + 1)]
+    else:
+        gaps = None
+    
+    for start, end in inner_spans(text, positions, gaps):
+        yield text[start:end]
+
+
+def find_many(text, words, case=False):
+    """
+    Find the quotes within a string that contain each of several words.
+    
+    Required arguments:
+    text  -- string in which to search
+    words -- list of words that quotes must contain
+    
+    Optional keyword arguments:
+    case  -- whether to match the case of the words
+             defaults to False (i.e. case-insensitive search)
+    
+    Returns:
+    dictionary from each word to a list of the quote strings that contain it, \
+    the same quotes as find() returns for the word
+    
+    The quote characters and the words are each located in a single pass over the text, \
+    however many words there are. \
+    (Words that are not made only of word characters, such as phrases, \
+    are searched for one at a time with find().)
+    """
+    
+    if case:
+        key = str
     else:
-        target = ''
+        key = str.lower
+    
+    found = {}
+    single_pass = {}
+    for word in words:
+        if WORD_RE.fullmatch(word):
+            single_pass.setdefault(key(word), []).append(word)
+        else:
+            found[word] = list(find(text, word, case))
     
-    pattern = OPENQUOTE_RE + FILLER_RE + target + FILLER_RE + CLOSEQUOTE_RE
+    # Where each word occurs.
+    starts = {k: [] for k in single_pass}
+    for match in WORD_RE.finditer(text):
+        k = key(match[0])
+        if k in starts:
+            starts[k].append(match.start())
     
-    # Yield just the matched text from each match object.
-    for match in re.finditer(pattern, text, flags):
-        yield match[0]
+    positions = quote_positions(text)
+    for k, word_starts in starts.items():
+        quotes = [text[start:end]
+                  for start, end in inner_spans(text, positions, _gaps(positions, word_starts))]
+        for word in single_pass[k]:
+            found[word] = list(quotes)
+    
+    return {word: found[word] for word in words}
 
 
 def remove(text, ellipsis=' ', invert=False):
@@ -88,16 +281,181 @@ def remove(text, ellipsis=' ', invert=False):
     modified string
     """
     
-    pattern = OPENQUOTE_RE + '.*?' + CLOSEQUOTE_RE
+    quotes = spans(text)
     
     if invert:
-        return ellipsis.join([match[0] for match in re.finditer(pattern, text)])
+        return ellipsis.join([text[start:end] for start, end in quotes])
+    
+    # The text before, between and after the quotes.
+    bounds = [0] + [i for span in quotes for i in span] + [len(text)]
+    return ellipsis.join([text[bounds[i]:bounds[i + 1]] for i in range(0, len(bounds), 2)])
+
+
+def remove_stream(src, dst, ellipsis=' ', invert=False, chunk_size=2**20, spool_size=2**22):
+    """
+    Remove quotes from a text file, writing the result to another text file.
+    
+    Required arguments:
+    src        -- file object to read the text from (opened in text mode)
+    dst        -- file object to write the modified text to (opened in text mode)
+    
+    Optional keyword arguments:
+    ellipsis   -- string to insert in place of removed text
+                  defaults to space (' ')
+    invert     -- if True, remove unquoted text
+                  defaults to False
+    chunk_size -- number of characters to read at a time
+                  defaults to 2**20
+    spool_size -- number of characters of an unfinished quote to keep in memory \
+                  before moving it to a temporary file
+                  defaults to 2**22
+    
+    Writes the same text as remove() would return for the whole text, \
+    reading one chunk at a time. Whether an opening quote character starts a quote \
+    is only known when a closing quote character or the end of the line is reached, \
+    so the text in between is held back until then, \
+    in a temporary file if it is long, so memory use does not grow with the text.
+    """
+    
+    # The unfinished quote (if there is one), and the character before the current chunk.
+    pending = None
+    previous = ''
+    first = True
+    
+    def flush_pending(rest):
+        # Write the held back text, and the rest of it from the current chunk.
+        pending.write(rest)
+        pending.seek(0)
+        shutil.copyfileobj(pending, dst)
+        pending.close()
+    
+    for chunk in iter(lambda: src.read(chunk_size), ''):
+        # The start of the text of the chunk that has not been written or held back yet.
+        start = 0
+        for match in EVENT_RE.finditer(chunk):
+            i = match.start()
+            char = chunk[i]
+            before = chunk[i - 1] if i else previous
+            if pending is None:
+                if char in OPENQUOTE_CHARS and (not before or before.isspace()):
+                    if not invert:
+                        dst.write(chunk[start:i])
+                    start = i
+                    pending = tempfile.SpooledTemporaryFile(spool_size, mode='w+',
+                                                            encoding='utf-8', newline='')
+            elif char == '\n':
+                # The quote did not close on its line, so it was not a quote after all.
+                if invert:
+                    pending.close()
+                else:
+                    flush_pending(chunk[start:i])
+                start = i
+                pending = None
+            elif char in CLOSEQUOTE_CHARS and not before.isspace():
+                if invert:
+                    if not first:
+                        dst.write(ellipsis)
+                    flush_pending(chunk[start:i + 1])
+                else:
+                    pending.close()
+                    dst.write(ellipsis)
+                start = i + 1
+                pending = None
+                first = False
+        if pending is not None:
+            pending.write(chunk[start:])
+        elif not invert:
+            dst.write(chunk[start:])
+        previous = chunk[-1]
     
-    return re.sub(pattern, ellipsis, text)
+    # An unfinished quote at the end of the text was not a quote either.
+    if pending is not None:
+        if invert:
+            pending.close()
+        else:
+            flush_pending('')
+
+
+def _find_list(text, word='', case=False):
+    return list(find(text, word, case))
+
+
+def _map(func, texts, workers=None, chunksize=None, min_chars=None):
+    """
+    Return func applied to each of some texts, in order, \
+    in a pool of processes if there is enough work for it to pay off.
+    """
+    texts = list(texts)
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if min_chars is None:
+        min_chars = MIN_PARALLEL_CHARS
+    if workers <= 1 or len(texts) <= 1 or sum(map(len, texts)) < min_chars:
+        return [func(text) for text in texts]
+    if chunksize is None:
+        # About four chunks per process, to balance the load without too many messages.
+        chunksize = max(1, len(texts) // (4 * workers))
+    with ProcessPoolExecutor(workers) as executor:
+        return list(executor.map(func, texts, chunksize=chunksize))
+
+
+def remove_many(texts, ellipsis=' ', invert=False, workers=None, chunksize=None, min_chars=None):
+    """
+    Remove quotes from each of several strings.
+    
+    Required arguments:
+    texts     -- sequence of strings from which to remove quotes
+    
+    Optional keyword arguments:
+    ellipsis  -- string to insert in place of removed text
+                 defaults to space (' ')
+    invert    -- if True, remove unquoted text
+                 defaults to False
+    workers   -- number of processes
+                 defaults to None (the number of CPUs)
+    chunksize -- number of strings to send to a process at a time
+                 defaults to None (about four chunks per process)
+    min_chars -- total number of characters below which to work in this process
+                 defaults to None (MIN_PARALLEL_CHARS)
+    
+    Returns:
+    list of modified strings, in the same order as the texts
+    """
+    return _map(functools.partial(remove, ellipsis=ellipsis, invert=invert),
+                texts, workers, chunksize, min_chars)
+
+
+def find_many_docs(texts, word='', case=False, workers=None, chunksize=None, min_chars=None):
+    """
+    Find quotes within each of several strings.
+    
+    Required arguments:
+    texts     -- sequence of strings in which to search
+    
+    Optional keyword arguments:
+    word      -- word that quotes must contain
+                 defaults to '' (i.e. find all quotes)
+    case      -- whether to match the case of the word
+                 defaults to False (i.e. case-insensitive search)
+    workers   -- number of processes
+                 defaults to None (the number of CPUs)
+    chunksize -- number of strings to send to a process at a time
+                 defaults to None (about four chunks per process)
+    min_chars -- total number of characters below which to work in this process
+                 defaults to None (MIN_PARALLEL_CHARS)
+    
+    Returns:
+    list of lists of quote strings, in the same order as the texts \
+    (for each text, the quotes that find() returns for it)
+    """
+    return _map(functools.partial(_find_list, word=word, case=case),
+                texts, workers, chunksize, min_chars)
 
 
 if __name__ == '__main__':
     
+    import io
+    
     exampleText = open('example.txt').read()
     exampleShortText = exampleText.splitlines()[0]
     exampleWord = 'Fuck'
@@ -112,6 +470,12 @@ if __name__ == '__main__':
     for quote in find(exampleText, exampleWord, case=True):
         print(quote)
     
+    # Test find_many().
+    exampleWords = ['Fuck', 'shit', 'normal']
+    print('\nCase insensitive search for {}:'.format(exampleWords))
+    for word, quotes in find_many(exampleText, exampleWords).items():
+        print('{}: {} quotes'.format(word, len(quotes)))
+    
     # Test remove().
     print('\nRemove quotes:')
     print(remove(exampleShortText, ellipsis=' [...] '))
@@ -119,3 +483,16 @@ if __name__ == '__main__':
     # Test remove() inverted.
     print('\nRemove non-quotes:')
     print(remove(exampleShortText, ellipsis=' [...] ', invert=True))
+    
+    # Test remove_stream() on the whole file, a chunk at a time.
+    print('\nRemove quotes from the file in chunks:')
+    streamed = io.StringIO()
+    with open('example.txt') as f:
+        remove_stream(f, streamed, ellipsis=' [...] ')
+    print('same as remove():', streamed.getvalue() == remove(exampleText, ellipsis=' [...] '))
+    
+    # Test remove_many() on the paragraphs of the text.
+    paragraphs = exampleText.splitlines()
+    print('\nRemove quotes from {} paragraphs:'.format(len(paragraphs)))
+    print('same as remove():',
+          remove_many(paragraphs) == [remove(paragraph) for paragraph in paragraphs])
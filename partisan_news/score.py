@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Score the partisanship of every text in large data files with a saved model.
+
+The files are read in chunks of texts (one text per line, as in mainstream.txt), \
+and the chunks are scored in a pool of worker processes, each with its own copy of the model. \
+Only a few chunks are in memory at a time, so files of any size can be scored. \
+Results are written as they come in, in the same order as the texts, \
+as CSV or as JSON lines.
+
+Run as a script, for example:
+python score.py model new_articles.txt more_articles.txt --output scores.csv
+python score.py model new_articles.txt --format jsonl --top 5
+
+The number of texts scored per second is reported at the end.
+"""
+
+import argparse
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import csv
+import json
+import sys
+import time
+
+import explain
+import server
+import streaming
+
+
+def read_chunks(filenames, chunk_size=500, encoding='utf-8'):
+    """
+    Yield (filename, first index, texts) for chunks of up to chunk_size texts from some files.
+    The index of a text is its position among the texts in its file, starting at 0.
+    """
+    for filename in filenames:
+        texts = []
+        start = 0
+        for text in streaming.read_texts(filename, encoding):
+            texts.append(text)
+            if len(texts) == chunk_size:
+                yield filename, start, texts
+                start += len(texts)
+                texts = []
+        if texts:
+            yield filename, start, texts
+
+
+# The explainer of the model of a worker process.
+# Loaded once per process by _init_worker(), rather than sent with each chunk.
+_explainer = None
+
+
+def _init_worker(path, positive_label='partisan'):
+    global _explainer
+    _explainer = explain.Explainer(server.load_model(path), positive_label)
+
+
+def score_chunk(texts, top=0):
+    """
+    Score a chunk of texts with the worker's model.
+    
+    Returns:
+    list of P(partisan) for each text
+    and a list of their top features (or None if top is 0), \
+    each a list of (feature, contribution) pairs, largest first
+    """
+    if not top:
+        X = _explainer.transform(texts)
+        classifier = _explainer.model.steps[-1][1]
+        return classifier.predict_proba(X)[:, _explainer.positive].tolist(), None
+    probs, names, contributions = _explainer.explain(texts, top)
+    # Drop the padding of texts with fewer than top features.
+    explanations = [[(name, value) for name, value in zip(text_names, text_contributions) if name]
+                    for text_names, text_contributions in zip(names.tolist(), contributions.tolist())]
+    return probs.tolist(), explanations
+
+
+def score_files(path, filenames, chunk_size=500, n_jobs=1, top=0):
+    """
+    Yield (filename, index, P(partisan), top features) for each text in some files.
+    
+    Required arguments:
+    path       -- saved model folder or pickle file
+    filenames  -- list of files of texts (with extension)
+    
+    Optional keyword arguments:
+    chunk_size -- number of texts to score at a time
+                  defaults to 500
+    n_jobs     -- number of worker processes
+                  defaults to 1 (score in this process)
+    top        -- number of top features to report for each text
+                  defaults to 0 (none)
+    """
+    chunks = read_chunks(filenames, chunk_size)
+    
+    def results(filename, start, scored):
+        probs, explanations = scored
+        for i, prob in enumerate(probs):
+            yield filename, start + i, prob, explanations[i] if explanations else None
+    
+    if n_jobs == 1:
+        _init_worker(path)
+        for filename, start, texts in chunks:
+            yield from results(filename, start, score_chunk(texts, top))
+        return
+    
+    # Keep at most two chunks per worker in flight, to bound memory.
+    with ProcessPoolExecutor(n_jobs, initializer=_init_worker, initargs=(path,)) as executor:
+        pending = deque()
+        for filename, start, texts in chunks:
+            pending.append((filename, start, executor.submit(score_chunk, texts, top)))
+            if len(pending) >= 2 * n_jobs:
+                filename, start, future = pending.popleft()
+                yield from results(filename, start, future.result())
+        while pending:
+            filename, start, future = pending.popleft()
+            yield from results(filename, start, future.result())
+
+
+if __name__ == '__main__':
+    
+    from settings import scoring_settings
+    
+    parser = argparse.ArgumentParser(description='Score the texts in data files.')
+    parser.add_argument('model', help='saved model folder or pickle file')
+    parser.add_argument('filenames', nargs='+', help='files of texts, one per line')
+    parser.add_argument('--output', help='file to write the scores to (default: standard output)')
+    parser.add_argument('--format', choices=['csv', 'jsonl'], default='csv')
+    parser.add_argument('--top', type=int, default=0,
+                        help='number of top contributing features to report per text')
+    parser.add_argument('--chunk-size', type=int, default=scoring_settings['chunk_size'])
+    parser.add_argument('--n-jobs', type=int, default=scoring_settings['n_jobs'])
+    args = parser.parse_args()
+    
+    output = open(args.output, mode='w', encoding='utf-8', newline='') if args.output else sys.stdout
+    writer = csv.writer(output)
+    if args.format == 'csv':
+        writer.writerow(['file', 'index', 'p_partisan'] + (['top_features'] if args.top else []))
+    start = time.perf_counter()
+    n_docs = 0
+    for filename, index, prob, explanation in score_files(args.model, args.filenames,
+                                                          chunk_size=args.chunk_size,
+                                                          n_jobs=args.n_jobs,
+                                                          top=args.top):
+        if args.format == 'csv':
+            row = [filename, index, '{:.6f}'.format(prob)]
+            if args.top:
+                row.append('; '.join('{}:{:.3f}'.format(*pair) for pair in explanation))
+            writer.writerow(row)
+        else:
+            record = {'file': filename, 'index': index, 'p_partisan': prob}
+            if args.top:
+                record['top_features'] = explanation
+            output.write(json.dumps(record) + '\n')
+        n_docs += 1
+    seconds = time.perf_counter() - start
+    if output is not sys.stdout:
+        output.close()
+    print('{} texts in {:.1f} s: {:.1f} texts/sec'.format(n_docs, seconds, n_docs / seconds),
+          file=sys.stderr)
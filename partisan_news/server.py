@@ -0,0 +1,281 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+A server for scoring the partisanship of texts with a fitted model.
+
+Requests that arrive at about the same time are gathered into micro-batches, \
+and each batch is scored with a single call to model.predict_proba(). \
+This shares the cost of the pipeline (and of spacy) across many requests.
+
+Run as a script, for example:
+python server.py model --port 8000
+python server.py model --unix /tmp/partisan.sock
+
+Then POST a JSON object like {"text": "..."} to /score \
+to get back {"p_partisan": ...}, \
+or GET /stats for the latency percentiles and batch sizes so far.
+"""
+
+import argparse
+import asyncio
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+import json
+import os
+import pickle
+import time
+
+import numpy as np
+
+import artifact
+
+
+class BatchScorer:
+    """
+    Score texts in micro-batches.
+    
+    Call BatchScorer.score() from coroutines.
+    A background task collects the waiting texts into batches of up to \
+    max_batch_size, waiting at most max_wait seconds for a batch to fill.
+    """
+    
+    def __init__(self, model, max_batch_size=64, max_wait=0.005,
+                 positive_label='partisan', n_latencies=10000):
+        """
+        Required arguments:
+        model          -- fitted pipeline with a predict_proba() method
+        
+        Optional keyword arguments:
+        max_batch_size -- maximum number of texts per call to predict_proba()
+                          defaults to 64
+        max_wait       -- maximum time in seconds to wait for a batch to fill
+                          defaults to 0.005
+        positive_label -- class label to return the probability of
+                          defaults to 'partisan'
+        n_latencies    -- number of recent latencies to keep for the statistics
+                          defaults to 10000
+        """
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.column = list(model.classes_).index(positive_label)
+        self.latencies = deque([], n_latencies)
+        self.batch_sizes = Counter()
+        self.queue = None
+        self.task = None
+        # One thread, so that batches are scored one after another,
+        # while the next batch collects in the queue.
+        self.executor = ThreadPoolExecutor(max_workers=1)
+    
+    def start(self):
+        """
+        Start the background batching task (inside a running event loop).
+        """
+        self.queue = asyncio.Queue()
+        self.task = asyncio.ensure_future(self._run())
+    
+    async def score(self, text):
+        """
+        Return the probability of the positive label for a text.
+        """
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((text, future, time.perf_counter()))
+        return await future
+    
+    def stats(self):
+        """
+        Return a dictionary of latency percentiles (in ms) and batch size statistics.
+        """
+        stats = {'requests': sum(size * n for size, n in self.batch_sizes.items()),
+                 'batches': sum(self.batch_sizes.values())}
+        if self.latencies:
+            latencies = np.array(self.latencies) * 1000
+            for p in [50, 95, 99]:
+                stats['p{} ms'.format(p)] = float(np.percentile(latencies, p))
+        if stats['batches']:
+            stats['mean batch size'] = stats['requests'] / stats['batches']
+            stats['batch sizes'] = dict(sorted(self.batch_sizes.items()))
+        return stats
+    
+    async def _next_batch(self):
+        # Wait for the first text, then for more until the batch is full or time is up.
+        batch = [await self.queue.get()]
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            if not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+                continue
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+    
+    def _predict(self, texts):
+        # Return the probability for each text, or the exception raised scoring it.
+        # If the batch fails, score its texts one at a time,
+        # so that one bad text doesn't fail the others.
+        try:
+            return list(self.model.predict_proba(texts)[:, self.column])
+        except Exception as error:
+            if len(texts) == 1:
+                return [error]
+        results = []
+        for text in texts:
+            try:
+                results.append(self.model.predict_proba([text])[0, self.column])
+            except Exception as error:
+                results.append(error)
+        return results
+    
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._next_batch()
+            texts = [text for text, future, start in batch]
+            results = await loop.run_in_executor(self.executor, self._predict, texts)
+            end = time.perf_counter()
+            for (text, future, start), result in zip(batch, results):
+                if future.done():
+                    continue
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                else:
+                    future.set_result(float(result))
+                self.latencies.append(end - start)
+            self.batch_sizes[len(batch)] += 1
+
+
+#%% HTTP front end
+
+STATUS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+          500: 'Internal Server Error'}
+
+
+def http_response(status, content):
+    """
+    Return the bytes of an HTTP response with a JSON body.
+    """
+    body = json.dumps(content).encode('utf-8')
+    head = ('HTTP/1.1 {} {}\r\n'
+            'Content-Type: application/json\r\n'
+            'Content-Length: {}\r\n\r\n').format(status, STATUS[status], len(body))
+    return head.encode('ascii') + body
+
+
+async def read_request(reader):
+    """
+    Read one HTTP request from a stream.
+    
+    Returns:
+    (method, path, headers, body), or None if the connection was closed
+    """
+    request_line = await reader.readline()
+    if not request_line:
+        return None
+    method, path, version = request_line.decode('latin-1').split()
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, value = line.decode('latin-1').split(':', 1)
+        headers[name.strip().lower()] = value.strip()
+    body = await reader.readexactly(int(headers.get('content-length', 0)))
+    return method, path, headers, body
+
+
+def make_handler(scorer):
+    """
+    Return a connection handler for asyncio.start_server() or start_unix_server().
+    Connections are kept alive for several requests unless the client asks to close.
+    """
+    async def handle(reader, writer):
+        try:
+            while True:
+                request = await read_request(reader)
+                if request is None:
+                    break
+                method, path, headers, body = request
+                if path == '/stats':
+                    response = http_response(200, scorer.stats())
+                elif path != '/score':
+                    response = http_response(404, {'error': 'unknown path'})
+                elif method != 'POST':
+                    response = http_response(405, {'error': 'use POST'})
+                else:
+                    try:
+                        text = json.loads(body.decode('utf-8'))['text']
+                    except (ValueError, KeyError, TypeError):
+                        text = None
+                    if not isinstance(text, str):
+                        response = http_response(400, {'error': 'expected {"text": "..."}'})
+                    else:
+                        try:
+                            response = http_response(200, {'p_partisan': await scorer.score(text)})
+                        except Exception as error:
+                            response = http_response(500, {'error': repr(error)})
+                writer.write(response)
+                await writer.drain()
+                if headers.get('connection', '').lower() == 'close':
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+    return handle
+
+
+def load_model(path):
+    """
+    Load a saved model and set it up for low-latency scoring:
+    tag in this process and don't cache the texts.
+    
+    The model can be a folder saved with artifact.save(), or a pickle file.
+    """
+    if os.path.isdir(path):
+        model = artifact.load(path)
+    else:
+        with open(path, mode='rb') as f:
+            model = pickle.load(f)
+    if 'tag' in model.named_steps:
+        model.set_params(tag__n_process=1, tag__cache=None)
+    return model
+
+
+async def serve(model, host='127.0.0.1', port=8000, unix_path=None, **kwargs):
+    """
+    Serve scores for a model until cancelled.
+    Additional keyword arguments are passed on to BatchScorer.
+    """
+    scorer = BatchScorer(model, **kwargs)
+    scorer.start()
+    handler = make_handler(scorer)
+    if unix_path:
+        server = await asyncio.start_unix_server(handler, path=unix_path)
+    else:
+        server = await asyncio.start_server(handler, host=host, port=port)
+    print('serving on', unix_path or '{}:{}'.format(host, port))
+    async with server:
+        await server.serve_forever()
+
+
+if __name__ == '__main__':
+    
+    parser = argparse.ArgumentParser(description='Serve partisanship scores over HTTP.')
+    parser.add_argument('model', help='saved model folder or pickle file')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--unix', help='serve on this Unix socket instead of a port')
+    parser.add_argument('--max-batch-size', type=int, default=64)
+    parser.add_argument('--max-wait-ms', type=float, default=5)
+    args = parser.parse_args()
+    
+    asyncio.run(serve(load_model(args.model),
+                      host=args.host, port=args.port, unix_path=args.unix,
+                      max_batch_size=args.max_batch_size,
+                      max_wait=args.max_wait_ms / 1000))
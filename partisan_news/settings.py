@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Parameters and settings for the partisan news pipeline.
+
+Shared by partisan_news.py and the other scripts in this folder, \
+so that they all preprocess and model the texts in the same way.
+"""
+
+import os
+
+
+parameters = {
+
+# Whether to remove quoted text.
+# Mainstream articles presumably sometimes quote partisan opinions.
+'remove_quotes': True,
+
+# Whether to replace the special 'curly' quote characters (‘’ and “”).
+# These may confuse the text parsing algorithms.
+'replace_curly_quotes': True,
+
+# How to find the lemma and part of speech of each word.
+# 'spacy' -- tag with spacy (accurate, slow)
+# 'fast'  -- look words up in a table built from spacy's tags (see fast_tagging.py)
+'backend': 'spacy',
+
+# Whether to strip surrounding punctuation from words.
+'strip_punctuation': True,
+
+# Which parts of speech to retain.
+# ADJectives
+# ADVerbs
+# INTerJections
+# NOUNs
+# VERBs
+'POS': ['ADJ', 'ADV', 'INTJ', 'NOUN', 'VERB'],
+
+# Whether to make all words lowercase.
+'lowercase': True,
+
+# Whether to discard words containing non-letter characters.
+# (Web addresses for example.)
+'letters_only': True,
+
+# Specific words to discard.
+# (For example words that happen to occur in a lot of partisan texts,
+# but clearly for arbitrary reasons like notices about ad blockers, etc.)
+'ignore': [
+'ad',
+'address',
+'article',
+'below',
+'blocker',
+'comment',
+'continue',
+'daily',
+'disable',
+'dose',
+'email',
+'image',
+'podcast',
+'read',
+'story',
+'video',
+'watch'
+],
+
+# Maximum length of ngrams.
+'max_ngram': 2,
+
+# Minimum document frequency for a term to be retained.
+# Terms that occur in fewer documents than this will be discarded.
+'min_occurrences': 10,
+
+# Maximum document frequency for a term to be retained.
+# Terms that occur in a greater proportion of documents than this will be discarded.
+'max_frequency': 0.9,
+
+# What proportion best features to retain.
+'p_best_features': 0.9,
+
+# How many folds to use in cross-validation.
+'k_folds': 5
+
+}
+
+# Which of the parameters above affect the output of preprocess().
+# These are part of the key for cached preprocessing results.
+preprocess_keys = ['remove_quotes', 'replace_curly_quotes', 'backend', 'strip_punctuation',
+                   'POS', 'lowercase', 'letters_only', 'ignore', 'max_ngram']
+
+# Where and how many preprocessed texts to cache.
+# Set 'directory' to None to cache only in memory.
+cache_settings = {'directory': '.preprocess_cache',
+                  'max_memory': 2000,
+                  'max_disk': 100000}
+
+# How to run spacy over the texts.
+# Number of texts per batch, and number of processes to tag batches in.
+tagger_settings = {'batch_size': 50,
+                   'n_process': os.cpu_count() or 1}
+
+# How to keep the memory used by the model down (see memory.py).
+# 'compact' -- whether to use float32 feature matrices and fitted arrays
+# 'report'  -- whether to log the memory used by each stage
+memory_settings = {'compact': True,
+                   'report': True}
+
+# Folder to save the fitted model in (see artifact.py).
+model_directory = 'model'
+
+# Folder to save the output of each stage of fitting in (see checkpoint.py),
+# and which of the parameters affect each stage.
+checkpoint_directory = '.checkpoints'
+checkpoint_stages = {'tag': preprocess_keys,
+                     'vectorize': ['min_occurrences', 'max_frequency'],
+                     'transform': [],
+                     'select': ['p_best_features']}
+
+# Whether to record the time and memory used by each stage of the pipeline (profiling.py).
+# Off by default: measuring memory with tracemalloc makes everything somewhat slower.
+profile_settings = {'enabled': False,
+                    'trace_memory': False}
+
+# How to cross-validate (parallel_cv.py).
+# Whether to tag the texts once and run the folds in parallel processes,
+# and how many processes to use (None for one per fold, up to the number of CPUs).
+validation_settings = {'parallel': True,
+                       'n_jobs': None}
+
+# How to train out-of-core (streaming.py).
+# Number of texts to read and train on at a time,
+# and number of hashed features (which fixes the memory needed for the model).
+streaming_settings = {'chunk_size': 500,
+                      'n_features': 2**20}
+
+# How to score large files of texts (score.py).
+# Number of texts to score at a time, and number of processes to score them in.
+scoring_settings = {'chunk_size': 500,
+                    'n_jobs': os.cpu_count() or 1}
+
+# Parameter values to try in a parameter sweep (sweep.py).
+# Any of the parameters above can be included.
+# Parameters not included keep the values above.
+sweep_grid = {'max_ngram': [1, 2, 3],
+              'min_occurrences': [5, 10, 20],
+              'max_frequency': [0.5, 0.9],
+              'p_best_features': [0.1, 0.5, 0.9],
+              'POS': [['ADJ', 'ADV', 'INTJ', 'NOUN', 'VERB'],
+                      ['ADJ', 'ADV', 'INTJ']]}
+
+# How to run the sweep.
+# 'n_iter' -- number of random combinations to try, or None to try them all
+# 'n_jobs' -- number of processes to evaluate combinations in
+sweep_settings = {'n_iter': None,
+                  'n_jobs': os.cpu_count() or 1,
+                  'random_state': 0}
+
+# How to evaluate the model's scores (evaluation.py).
+# Threshold for the summary metrics, number of bootstrap resamples,
+# confidence level of the intervals, and number of processes for the resamples.
+evaluation_settings = {'threshold': 0.5,
+                       'n_resamples': 2000,
+                       'confidence': 0.95,
+                       'n_jobs': os.cpu_count() or 1,
+                       'random_state': 0}
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Out-of-core training for the partisan news classifier.
+
+The texts are read from the data files in chunks, \
+turned into features with a HashingVectorizer (fixed memory, no vocabulary), \
+and the naive Bayes classifier is trained chunk by chunk with partial_fit().
+Peak memory then depends on the chunk size and the number of hashed features, \
+not on the size of the corpus.
+
+There is no tf-idf weighting or chi-squared feature selection in this mode, \
+since both need statistics of the whole corpus before anything can be transformed.
+
+Run as a script to train on mainstream.txt and partisan.txt in streaming mode \
+and report throughput and peak memory.
+"""
+
+import resource
+import sys
+import time
+
+from sklearn.feature_extraction.text import HashingVectorizer
+from sklearn.naive_bayes import MultinomialNB
+from sklearn.pipeline import Pipeline
+
+import preprocessing
+
+
+def read_texts(filename, encoding='utf-8'):
+    """
+    Yield the texts in a data file one at a time.
+    
+    Each text is a non-empty line followed by a newline.
+    (The same texts as re.findall('.+(?=\\n+)', ...) finds.)
+    """
+    with open(filename, encoding=encoding) as f:
+        for line in f:
+            if line.endswith('\n') and len(line) > 1:
+                yield line[:-1]
+
+
+def read_chunks(filenames, chunk_size=500, encoding='utf-8'):
+    """
+    Yield (texts, labels) lists of up to chunk_size texts from the data files.
+    
+    Required arguments:
+    filenames  -- list of file names without the '.txt' extension
+                  also used as the labels for the texts in each file
+    
+    Optional keyword arguments:
+    chunk_size -- maximum number of texts per chunk
+                  defaults to 500
+    encoding   -- encoding of the files
+                  defaults to 'utf-8'
+    """
+    texts = []
+    labels = []
+    for filename in filenames:
+        for text in read_texts(filename + '.txt', encoding):
+            texts.append(text)
+            labels.append(filename)
+            if len(texts) == chunk_size:
+                yield texts, labels
+                texts = []
+                labels = []
+    if texts:
+        yield texts, labels
+
+
+def peak_rss():
+    """
+    Return the peak resident memory of this process so far, in bytes.
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS reports bytes.
+    if sys.platform == 'darwin':
+        return peak
+    return peak * 1024
+
+
+def resource_report(n_docs, seconds):
+    """
+    Return a list of messages about throughput and peak memory,
+    for use with log_print().
+    """
+    return ['docs: {}'.format(n_docs),
+            'seconds: {:.2f}'.format(seconds),
+            'docs/sec: {:.1f}'.format(n_docs / seconds if seconds else float('nan')),
+            'peak RSS: {:.1f} MB'.format(peak_rss() / 2**20)]
+
+
+def make_model(parameters, n_features=2**20, tagger=None):
+    """
+    Return an unfitted streaming pipeline: tag, vectorize, classify.
+    
+    Required arguments:
+    parameters -- dictionary of preprocessing parameters
+    
+    Optional keyword arguments:
+    n_features -- number of hashed features
+                  defaults to 2**20
+                  the classifier stores two float64 counts per feature and class
+    tagger     -- preprocessing.Tagger to use
+                  defaults to a Tagger without a cache
+    """
+    if tagger is None:
+        tagger = preprocessing.Tagger(parameters)
+    # Raw counts of the hashed features, as naive Bayes expects.
+    vectorizer = HashingVectorizer(analyzer=preprocessing.identity,
+                                   n_features=n_features,
+                                   alternate_sign=False,
+                                   norm=None)
+    classifier = MultinomialNB(fit_prior=False)
+    return Pipeline([('tag', tagger),
+                     ('vectorize', vectorizer),
+                     ('classify', classifier)])
+
+
+def fit_streaming(model, chunks, classes):
+    """
+    Train a streaming pipeline chunk by chunk.
+    
+    Required arguments:
+    model   -- pipeline from make_model()
+    chunks  -- iterable of (texts, labels), for example from read_chunks()
+    classes -- list of all the labels
+    
+    Returns:
+    number of texts trained on
+    """
+    n_docs = 0
+    for texts, labels in chunks:
+        features = model.named_steps['tag'].transform(texts)
+        counts = model.named_steps['vectorize'].transform(features)
+        model.named_steps['classify'].partial_fit(counts, labels, classes=classes)
+        n_docs += len(texts)
+    return n_docs
+
+
+if __name__ == '__main__':
+    
+    from settings import parameters, tagger_settings, streaming_settings
+    
+    # Names of the text files to read from.
+    # Also used as the category labels for the two types of text.
+    filenames = ['mainstream', 'partisan']
+    
+    # Train chunk by chunk, with the same preprocessing as the batch mode.
+    tagger = preprocessing.Tagger(parameters, **tagger_settings)
+    model = make_model(parameters,
+                       n_features=streaming_settings['n_features'],
+                       tagger=tagger)
+    start = time.perf_counter()
+    n_docs = fit_streaming(model,
+                           read_chunks(filenames, streaming_settings['chunk_size']),
+                           filenames)
+    seconds = time.perf_counter() - start
+    print('[streaming fit]', *resource_report(n_docs, seconds), sep='\n')
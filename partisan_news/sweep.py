@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Search over the parameters of the partisan news pipeline.
+
+Tagging with spacy is by far the slowest step, \
+but most parameters only affect what happens after tagging. \
+So each text is tagged once, keeping just the lemma and part of speech of each token, \
+and every combination of parameters rebuilds its features from those annotations.
+(Only 'remove_quotes' and 'replace_curly_quotes' change the text that is tagged, \
+and 'backend' how it is tagged. \
+The texts are tagged once for each combination of those three.)
+
+The combinations are cross-validated in parallel processes.
+
+Run as a script to sweep the grid in settings.py over the training data \
+and write a table of the results to a .log file.
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+import math
+import time
+
+import numpy as np
+from sklearn.feature_extraction.text import CountVectorizer, TfidfTransformer
+from sklearn.feature_selection import chi2, SelectPercentile
+from sklearn.metrics import make_scorer
+from sklearn.metrics import accuracy_score, precision_score, recall_score, roc_auc_score
+from sklearn.model_selection import cross_validate, ParameterGrid, ParameterSampler
+from sklearn.naive_bayes import MultinomialNB
+from sklearn.pipeline import Pipeline
+
+import preprocessing
+
+
+# The parameters that change the text given to the tagger, or the tagger.
+CLEAN_KEYS = ['remove_quotes', 'replace_curly_quotes', 'backend']
+
+
+def make_model(parameters):
+    """
+    Return an unfitted pipeline for texts that have already been turned into features.
+    (The pipeline of partisan_news.py without the tagger.)
+    """
+    vectorizer = CountVectorizer(analyzer=preprocessing.identity,
+                                 min_df=parameters['min_occurrences'],
+                                 max_df=parameters['max_frequency'])
+    feature_selecter = SelectPercentile(chi2, percentile=math.ceil(parameters['p_best_features']*100))
+    return Pipeline([('vectorize', vectorizer),
+                     ('transform', TfidfTransformer()),
+                     ('select', feature_selecter),
+                     ('classify', MultinomialNB(fit_prior=False))])
+
+
+def make_scorers(pos_label='partisan'):
+    """
+    Return the performance metrics used in cross-validation.
+    """
+    return {'accuracy': make_scorer(accuracy_score),
+            'precision': make_scorer(precision_score, pos_label=pos_label),
+            'recall': make_scorer(recall_score, pos_label=pos_label),
+            'ROC_AUC': make_scorer(roc_auc_score,
+                                   response_method=('decision_function', 'predict_proba'))}
+
+
+def combinations(base_parameters, grid, n_iter=None, random_state=0):
+    """
+    Return a list of complete parameter dictionaries to try.
+    
+    Required arguments:
+    base_parameters -- dictionary of the default parameters
+    grid            -- dictionary of lists of values to try for some parameters
+    
+    Optional keyword arguments:
+    n_iter          -- number of random combinations to draw from the grid
+                       defaults to None (all combinations)
+    random_state    -- seed for drawing random combinations
+                       defaults to 0
+    """
+    if n_iter is None:
+        points = ParameterGrid(grid)
+    else:
+        points = ParameterSampler(grid, n_iter, random_state=random_state)
+    return [dict(base_parameters, **point) for point in points]
+
+
+def annotate_all(texts, parameter_list, batch_size=50, n_process=1):
+    """
+    Tag the texts once for each distinct combination of the cleaning parameters.
+    
+    Returns:
+    dictionary from tuples of cleaning parameter values to lists of annotations
+    """
+    annotations = {}
+    for parameters in parameter_list:
+        clean_values = tuple(parameters[key] for key in CLEAN_KEYS)
+        if clean_values not in annotations:
+            annotations[clean_values] = preprocessing.annotate(texts, parameters,
+                                                               batch_size=batch_size,
+                                                               n_process=n_process)
+    return annotations
+
+
+# Data shared by the worker processes.
+# Set once per process by _init_worker(), rather than sent with each combination.
+_annotations = None
+_labels = None
+
+
+def _init_worker(annotations, labels):
+    global _annotations, _labels
+    _annotations = annotations
+    _labels = labels
+
+
+def evaluate(parameters, pos_label='partisan'):
+    """
+    Cross-validate one combination of parameters on the shared annotations.
+    
+    Returns:
+    dictionary of mean scores and the time taken
+    """
+    start = time.perf_counter()
+    clean_values = tuple(parameters[key] for key in CLEAN_KEYS)
+    features = [preprocessing.features_from_annotations(annotation, parameters)
+                for annotation in _annotations[clean_values]]
+    cv_result = cross_validate(make_model(parameters), features, _labels,
+                               cv=parameters['k_folds'],
+                               scoring=make_scorers(pos_label))
+    scores = {key[len('test_'):]: np.mean(value)
+              for key, value in cv_result.items() if key.startswith('test_')}
+    scores['seconds'] = time.perf_counter() - start
+    return scores
+
+
+def run(texts, labels, parameter_list, n_jobs=1, batch_size=50, n_process=1):
+    """
+    Evaluate each combination of parameters.
+    
+    Required arguments:
+    texts          -- list of raw texts
+    labels         -- list of their labels
+    parameter_list -- list of parameter dictionaries, for example from combinations()
+    
+    Optional keyword arguments:
+    n_jobs         -- number of processes to evaluate combinations in
+                      defaults to 1
+    batch_size     -- number of texts per batch sent to spacy
+                      defaults to 50
+    n_process      -- number of processes for spacy to use
+                      defaults to 1
+    
+    Returns:
+    list of score dictionaries, in the same order as parameter_list
+    """
+    annotations = annotate_all(texts, parameter_list, batch_size, n_process)
+    if n_jobs == 1:
+        _init_worker(annotations, labels)
+        return [evaluate(parameters) for parameters in parameter_list]
+    with ProcessPoolExecutor(n_jobs, initializer=_init_worker,
+                             initargs=(annotations, labels)) as executor:
+        return list(executor.map(evaluate, parameter_list))
+
+
+def table(parameter_list, results, keys):
+    """
+    Return the results as lines of a tab-separated table, best ROC AUC first.
+    
+    Required arguments:
+    parameter_list -- list of parameter dictionaries
+    results        -- list of score dictionaries from run()
+    keys           -- names of the parameters to show
+    """
+    score_names = list(results[0])
+    rows = sorted(zip(parameter_list, results),
+                  key=lambda row: row[1].get('ROC_AUC', 0), reverse=True)
+    lines = ['\t'.join(keys + score_names)]
+    for parameters, scores in rows:
+        cells = [str(parameters[key]) for key in keys]
+        cells += ['{:.3f}'.format(scores[name]) for name in score_names]
+        lines.append('\t'.join(cells))
+    return lines
+
+
+if __name__ == '__main__':
+    
+    from sklearn.model_selection import train_test_split
+    
+    from settings import parameters, tagger_settings, sweep_grid, sweep_settings
+    import corpus
+    
+    # Read the texts, and use only the training data (as in partisan_news.py).
+    documents = corpus.Corpus(['mainstream', 'partisan'])
+    train_items, test_items, train_labels, test_labels = train_test_split(
+        documents.view(), documents.labels, stratify=documents.labels, random_state=0)
+    
+    parameter_list = combinations(parameters, sweep_grid,
+                                  n_iter=sweep_settings['n_iter'],
+                                  random_state=sweep_settings['random_state'])
+    print('{} combinations'.format(len(parameter_list)))
+    start = time.perf_counter()
+    results = run(train_items, train_labels, parameter_list,
+                  n_jobs=sweep_settings['n_jobs'], **tagger_settings)
+    seconds = time.perf_counter() - start
+    
+    # Write the table to a results file.
+    timestamp = datetime.now().strftime('%d_%b_%Y_%H%M')
+    lines = table(parameter_list, results, list(sweep_grid))
+    with open(timestamp + '_sweep.log', mode='w', encoding='utf-8') as f:
+        f.write('PARTISAN NEWS PARAMETER SWEEP\n{}\n\n'.format(timestamp))
+        f.write('[{} combinations in {:.1f} s]\n'.format(len(parameter_list), seconds))
+        f.write('\n'.join(lines) + '\n')
+    print(*lines, sep='\n')
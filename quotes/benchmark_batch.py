@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Find the batch size at which remove_many() and find_many_docs() \
+become faster in a pool of processes than in this process.
+
+The batches are paragraphs of example.txt (repeated as needed). \
+Each batch is processed in this process and in a pool of processes \
+(with min_chars=0, so the pool is always used), and the times are compared. \
+The total number of characters at the crossover is a guide for quotes.MIN_PARALLEL_CHARS.
+"""
+
+import os
+import sys
+from timeit import timeit
+
+import quotes
+
+
+def seconds(func, number=3):
+    """
+    Return the mean time in seconds taken by a function.
+    """
+    return timeit(func, number=number) / number
+
+
+if __name__ == '__main__':
+    
+    with open('example.txt', encoding='utf-8') as f:
+        paragraphs = [line for line in f.read().splitlines() if line]
+    workers = int(sys.argv[1]) if len(sys.argv) > 1 else max(2, os.cpu_count() or 1)
+    print('{} CPUs, {} worker processes'.format(os.cpu_count(), workers))
+    
+    cases = {'remove_many': lambda texts, **kwargs: quotes.remove_many(texts, **kwargs),
+             'find_many_docs': lambda texts, **kwargs: quotes.find_many_docs(texts, 'Fuck', **kwargs)}
+    
+    for name, func in cases.items():
+        print('\n{}\ntexts\tcharacters\tin process s\tpool s\tspeedup'.format(name))
+        crossover = None
+        for n_texts in [10, 100, 1000, 3000, 10000, 30000]:
+            texts = [paragraphs[i % len(paragraphs)] for i in range(n_texts)]
+            n_chars = sum(map(len, texts))
+            serial = seconds(lambda: func(texts, workers=1))
+            pool = seconds(lambda: func(texts, workers=workers, min_chars=0))
+            print('{}\t{}\t{:.4f}\t{:.4f}\t{:.2f}x'.format(n_texts, n_chars, serial, pool, serial / pool))
+            if crossover is None and pool < serial:
+                crossover = n_chars
+        if crossover is None:
+            print('the pool was not faster for any batch')
+        else:
+            print('the pool was faster from {} characters'.format(crossover))
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Compare the time taken to find and remove quotes in long texts:
+with the span scanner of quotes.py, or with the regexes it replaced.
+
+Checks that both give the same results, then times both on:
+example.txt repeated to several megabytes, \
+and a long line full of opening quotes that are never closed \
+(which the non-greedy regex of remove() searches to the end of the line from each one).
+"""
+
+import re
+from timeit import timeit
+
+import quotes
+from quotes import OPENQUOTE_RE, CLOSEQUOTE_RE, FILLER_RE
+
+
+def regex_find(text, word='', case=False):
+    """
+    Find quotes within a string with a regex (the previous quotes.find()).
+    """
+    
+    if case:
+        flags = 0
+    else:
+        flags = re.IGNORECASE
+    
+    if word:
+        target = r'(?<=\W){}(?=\W)'.format(word)
+    else:
+        target = ''
+    
+    pattern = OPENQUOTE_RE + FILLER_RE + target + FILLER_RE + CLOSEQUOTE_RE
+    
+    for match in re.finditer(pattern, text, flags):
+        yield match[0]
+
+
+def regex_remove(text, ellipsis=' ', invert=False):
+    """
+    Remove quotes from a string with a regex (the previous quotes.remove()).
+    """
+    
+    pattern = OPENQUOTE_RE + '.*?' + CLOSEQUOTE_RE
+    
+    if invert:
+        return ellipsis.join([match[0] for match in re.finditer(pattern, text)])
+    
+    return re.sub(pattern, ellipsis, text)
+
+
+def seconds(func, number=3):
+    """
+    Return the mean time in seconds taken by a function.
+    """
+    return timeit(func, number=number) / number
+
+
+if __name__ == '__main__':
+    
+    with open('example.txt', encoding='utf-8') as f:
+        example = f.read()
+    texts = {'example.txt x 4': example * 4,
+             'unclosed quotes': 'He said “no ' * 5000}
+    word = 'Fuck'
+    
+    cases = {'find(text)': (lambda text: list(regex_find(text)),
+                            lambda text: list(quotes.find(text))),
+             'find(text, word)': (lambda text: list(regex_find(text, word)),
+                                  lambda text: list(quotes.find(text, word))),
+             'remove(text)': (regex_remove, quotes.remove),
+             'remove(text, invert=True)': (lambda text: regex_remove(text, invert=True),
+                                           lambda text: quotes.remove(text, invert=True))}
+    
+    for name, text in texts.items():
+        print('\n{} ({:.1f} MB)'.format(name, len(text.encode('utf-8')) / 2**20))
+        print('function\tregex s\tspans s\tspeedup\tsame result')
+        for case, (old, new) in cases.items():
+            same = old(text) == new(text)
+            old_seconds = seconds(lambda: old(text))
+            new_seconds = seconds(lambda: new(text))
+            print('{}\t{:.3f}\t{:.3f}\t{:.1f}x\t{}'.format(
+                case, old_seconds, new_seconds, old_seconds / new_seconds, same))
@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+An index of the quotes in a collection of documents, saved in an SQLite database.
+
+When a document is added, its quotes are found once, as by quotes.find(), \
+and stored with their offsets, along with postings from each lower-cased word \
+to the quotes it occurs in. Searching for the quotes that contain a word \
+then reads the database only, not the documents.
+
+A quote found by quotes.find() for a word depends on the word: \
+a quote character that closes a quote containing the word cannot open the next quote. \
+So every possible quote is stored (between any two consecutive quote characters \
+that can open and close a quote), and the search applies that rule to the possible quotes \
+that contain the word, giving the same quotes as quotes.find().
+"""
+
+import sqlite3
+
+import quotes
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (id INTEGER PRIMARY KEY, name TEXT UNIQUE);
+CREATE TABLE IF NOT EXISTS quotes (document INTEGER, gap INTEGER,
+                                   start INTEGER, end INTEGER, quote TEXT,
+                                   PRIMARY KEY (document, gap));
+CREATE TABLE IF NOT EXISTS postings (word TEXT, form TEXT, document INTEGER, gap INTEGER);
+CREATE INDEX IF NOT EXISTS postings_word ON postings (word);
+CREATE INDEX IF NOT EXISTS postings_document ON postings (document);
+"""
+
+# Characters that make a word a regex, which the postings cannot be used for.
+REGEX_CHARS = set('.^$*+?{}[]\\|()')
+
+
+class QuoteIndex:
+    """
+    An index of the quotes in a collection of documents.
+    Documents can be added at any time, and are saved as they are added.
+    """
+    
+    def __init__(self, filename):
+        """
+        Required arguments:
+        filename -- SQLite database to keep the index in (created if necessary)
+        """
+        self.filename = filename
+        self.connection = sqlite3.connect(filename)
+        self.connection.executescript(SCHEMA)
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exception):
+        self.close()
+    
+    def close(self):
+        self.connection.close()
+    
+    def __len__(self):
+        return self.connection.execute('SELECT COUNT(*) FROM documents').fetchone()[0]
+    
+    def __contains__(self, name):
+        return self.connection.execute('SELECT 1 FROM documents WHERE name = ?',
+                                       (name,)).fetchone() is not None
+    
+    def _add(self, name, text):
+        cursor = self.connection.cursor()
+        # Replace the document if it is already in the index.
+        row = cursor.execute('SELECT id FROM documents WHERE name = ?', (name,)).fetchone()
+        if row:
+            for table in ['quotes', 'postings']:
+                cursor.execute('DELETE FROM {} WHERE document = ?'.format(table), row)
+            cursor.execute('DELETE FROM documents WHERE id = ?', row)
+        cursor.execute('INSERT INTO documents (name) VALUES (?)', (name,))
+        document = cursor.lastrowid
+        
+        # Every possible quote, and the words in it.
+        positions = quotes.quote_positions(text)
+        rows = []
+        postings = set()
+        for gap in range(len(positions) - 1):
+            start = positions[gap]
+            end = positions[gap + 1] + 1
+            if quotes.is_opening(text, start) and quotes.is_closing(text, end - 1):
+                rows.append((document, gap, start, end, text[start:end]))
+                for match in quotes.WORD_RE.finditer(text, start, end):
+                    postings.add((match[0].lower(), match[0], document, gap))
+        cursor.executemany('INSERT INTO quotes VALUES (?, ?, ?, ?, ?)', rows)
+        cursor.executemany('INSERT INTO postings VALUES (?, ?, ?, ?)', postings)
+    
+    def add(self, name, text):
+        """
+        Add a document to the index (replacing any document with the same name).
+        """
+        with self.connection:
+            self._add(name, text)
+    
+    def add_many(self, documents):
+        """
+        Add some documents to the index, given as (name, text) pairs, in one transaction.
+        """
+        with self.connection:
+            for name, text in documents:
+                self._add(name, text)
+    
+    def find(self, word='', case=False):
+        """
+        Find the quotes in the indexed documents that contain a word.
+        
+        Optional keyword arguments:
+        word -- word that quotes must contain
+                defaults to '' (i.e. find all quotes)
+        case -- whether to match the case of the word
+                defaults to False (i.e. case-insensitive search)
+        
+        Returns:
+        list of (document name, start, end, quote) for each quote, \
+        in the order the documents were added (or last replaced) and then of the quotes
+        (for each document, the quotes that quotes.find() returns for it)
+        """
+        
+        columns = 'SELECT document, gap, start, end, quote FROM quotes'
+        if not word:
+            candidates = self.connection.execute(columns)
+            pattern = None
+        elif quotes.WORD_RE.fullmatch(word):
+            # A single word: the postings are enough.
+            if case:
+                postings = 'SELECT document, gap FROM postings WHERE word = ? AND form = ?'
+                parameters = [word.lower(), word]
+            else:
+                postings = 'SELECT document, gap FROM postings WHERE word = ?'
+                parameters = [word.lower()]
+            candidates = self.connection.execute(
+                columns + ' WHERE (document, gap) IN ({})'.format(postings), parameters)
+            pattern = None
+        else:
+            # Anything else (such as a phrase): the possible quotes that contain all its words,
+            # or all of them if it is a regex, each checked as by quotes.find().
+            tokens = quotes.WORD_RE.findall(word)
+            if tokens and not any(char in REGEX_CHARS for char in word):
+                postings = ' INTERSECT '.join(
+                    ['SELECT document, gap FROM postings WHERE word = ?'] * len(tokens))
+                candidates = self.connection.execute(
+                    columns + ' WHERE (document, gap) IN ({})'.format(postings),
+                    [token.lower() for token in tokens])
+            else:
+                candidates = self.connection.execute(columns)
+            pattern = quotes.compile_pattern(word, case)
+        
+        contains = {}
+        for document, gap, start, end, quote in candidates:
+            # Search after the opening quote character.
+            if pattern is None or pattern.search(quote, 1):
+                contains.setdefault(document, []).append((gap, start, end, quote))
+        
+        names = dict(self.connection.execute('SELECT id, name FROM documents'))
+        found = []
+        for document in sorted(contains):
+            # A quote character that closes a quote cannot open the next.
+            previous = None
+            for gap, start, end, quote in sorted(contains[document]):
+                if previous != gap - 1:
+                    found.append((names[document], start, end, quote))
+                    previous = gap
+        return found
+
+
+if __name__ == '__main__':
+    
+    import time
+    
+    # Index each paragraph of the example text as a document.
+    with open('example.txt') as f:
+        paragraphs = [(str(i), line) for i, line in enumerate(f.read().splitlines()) if line]
+    start = time.perf_counter()
+    with QuoteIndex('example_quotes.db') as index:
+        index.add_many(paragraphs)
+        print('{} documents indexed in {:.2f} s'.format(len(index), time.perf_counter() - start))
+        
+        # Search the index, and check it finds the same quotes as quotes.find().
+        for word, case in [('Fuck', False), ('Fuck', True), ('my best friend', False)]:
+            start = time.perf_counter()
+            found = index.find(word, case)
+            seconds = time.perf_counter() - start
+            expected = [quote for name, text in paragraphs for quote in quotes.find(text, word, case)]
+            print('{} quotes containing "{}" (case {}) in {:.3f} s, same as quotes.find(): {}'.format(
+                len(found), word, case, seconds, [quote for *_, quote in found] == expected))